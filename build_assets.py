@@ -0,0 +1,189 @@
+import os
+import re
+import sys
+import glob
+import base64
+import shutil
+import subprocess
+import tempfile
+import requests
+
+from local_assets import BASE_DIR, ICON_DIR, BUILD_DIR
+
+# Byggsteg som gör mallarna oberoende av nätet:
+#  - Tailwind kompileras i förväg till en rensad css (istället för cdn.tailwindcss.com)
+#  - Lucide-ikonerna sparas som svg och bäddas in via lucide_icon()
+#  - Google Fonts laddas ner till assets/fonts och bäddas in i css:en
+#
+# Kör: python build_assets.py [mall.html ...]
+# Tailwind CLI (v3) hittas via TAILWIND_BIN, annars "tailwindcss" i PATH, annars npx.
+
+FONT_DIR = os.path.join(BASE_DIR, "assets", "fonts")
+DEFAULT_TEMPLATES = [os.path.join(BASE_DIR, "dashboard.html")] + sorted(glob.glob(os.path.join(BASE_DIR, "layout_styles", "*.html")))
+
+LUCIDE_URL = "https://unpkg.com/lucide-static@latest/icons/{name}.svg"
+
+# alla ikoner som get_icon_name i main.py kan returnera
+WEATHER_ICONS = [
+    "sun", "moon", "cloud-sun", "cloud-moon", "cloud", "cloud-fog", "cloud-drizzle",
+    "cloud-rain", "cloud-lightning", "cloud-hail", "snowflake",
+]
+
+WEIGHT_NAMES = {
+    100: "Thin", 200: "ExtraLight", 300: "Light", 400: "Regular",
+    500: "Medium", 600: "SemiBold", 700: "Bold", 800: "ExtraBold", 900: "Black",
+}
+
+TAILWIND_SCRIPT_RE = re.compile(r'\s*<script src="https://cdn\.tailwindcss\.com[^"]*"></script>')
+LUCIDE_SCRIPT_RE = re.compile(r'\s*<script src="https://unpkg\.com/lucide[^"]*"></script>')
+FONT_LINK_RE = re.compile(r'\s*<link href="(https://fonts\.googleapis\.com/[^"]+)" rel="stylesheet">')
+FONT_IMPORT_RE = re.compile(r"\s*@import url\('(https://fonts\.googleapis\.com/[^']+)'\);")
+ICON_TAG_RE = re.compile(r'<i data-lucide="([^"]+)"(?: class="([^"]*)")?\s*></i>')
+JINJA_VAR_RE = re.compile(r"^\{\{\s*([\w.]+)\s*\}\}$")
+FONT_FACE_RE = re.compile(r"@font-face\s*\{[^}]*\}")
+
+
+def download(url, path):
+    response = requests.get(url, timeout=30)
+    response.raise_for_status()
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(response.content)
+
+
+def fetch_icon(name):
+    path = os.path.join(ICON_DIR, f"{name}.svg")
+    if os.path.exists(path):
+        return
+    print(f"  ikon: {name}")
+    response = requests.get(LUCIDE_URL.format(name=name), timeout=30)
+    response.raise_for_status()
+    svg = re.sub(r"<!--.*?-->", "", response.text, flags=re.S).strip()
+    # klasserna sätts av lucide_icon() vid rendering
+    svg = re.sub(r'(<svg[^>]*?)\s+class="[^"]*"', r"\1", svg, count=1)
+    os.makedirs(ICON_DIR, exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(svg)
+
+
+def font_filename(family, weight, style):
+    suffix = WEIGHT_NAMES.get(weight, str(weight))
+    if style == "italic":
+        suffix = "Italic" if suffix == "Regular" else suffix + "Italic"
+    return f"{family.replace(' ', '')}-{suffix}.ttf"
+
+
+def build_font_css(css_url):
+    """
+    Laddar ner typsnitten som ttf (Google skickar ttf till klienter utan webbläsar-UA)
+    och returnerar @font-face-regler med typsnitten inbäddade som data-URI.
+    ttf-filerna används även av render_pillow.py.
+    """
+    response = requests.get(css_url, timeout=30)
+    response.raise_for_status()
+
+    rules = []
+    for block in FONT_FACE_RE.findall(response.text):
+        family = re.search(r"font-family:\s*'([^']+)'", block).group(1)
+        weight = int(re.search(r"font-weight:\s*(\d+)", block).group(1))
+        style = re.search(r"font-style:\s*(\w+)", block).group(1)
+        url = re.search(r"url\(([^)]+)\)", block).group(1)
+
+        path = os.path.join(FONT_DIR, font_filename(family, weight, style))
+        if not os.path.exists(path):
+            print(f"  typsnitt: {os.path.basename(path)}")
+            download(url, path)
+
+        with open(path, "rb") as f:
+            data = base64.b64encode(f.read()).decode("ascii")
+        rules.append(
+            f"@font-face{{font-family:'{family}';font-style:{style};font-weight:{weight};"
+            f"src:url(data:font/ttf;base64,{data}) format('truetype');}}"
+        )
+    return "\n".join(rules)
+
+
+def tailwind_command():
+    binary = os.environ.get("TAILWIND_BIN") or shutil.which("tailwindcss")
+    if binary:
+        return [binary]
+    if shutil.which("npx"):
+        return ["npx", "--yes", "tailwindcss@3"]
+    raise RuntimeError("Hittar inte Tailwind CLI, sätt TAILWIND_BIN eller installera tailwindcss.")
+
+
+def compile_tailwind(template_file):
+    """
+    Kör Tailwind CLI mot mallen så att bara klasserna som används kommer med.
+    Klasserna i kalenderns js-strängar hittas eftersom hela filen skannas.
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        input_css = os.path.join(tmp, "input.css")
+        output_css = os.path.join(tmp, "output.css")
+        with open(input_css, "w") as f:
+            f.write("@tailwind base;\n@tailwind components;\n@tailwind utilities;\n")
+
+        cmd = tailwind_command() + [
+            "-i", input_css,
+            "-o", output_css,
+            "--content", os.path.abspath(template_file),
+            "--minify",
+        ]
+        subprocess.run(cmd, check=True, capture_output=True)
+        with open(output_css, encoding="utf-8") as f:
+            return f.read()
+
+
+def replace_icon_tag(match, icon_names):
+    name_expr, css_class = match.group(1), match.group(2) or ""
+    var = JINJA_VAR_RE.match(name_expr)
+    if var:
+        icon_names.update(WEATHER_ICONS)
+        name_arg = var.group(1)
+    else:
+        icon_names.add(name_expr)
+        name_arg = repr(name_expr)
+    return f"{{{{ lucide_icon({name_arg}, {css_class!r}) }}}}"
+
+
+def build_template(template_file, tailwind_css=None):
+    """
+    Skriver en offline-version av mallen till build/ och returnerar ikonerna den använder.
+    """
+    with open(template_file, encoding="utf-8") as f:
+        html = f.read()
+
+    font_css = []
+    for regex in (FONT_LINK_RE, FONT_IMPORT_RE):
+        for url in regex.findall(html):
+            font_css.append(build_font_css(url))
+        html = regex.sub("", html)
+
+    icon_names = set()
+    html = ICON_TAG_RE.sub(lambda m: replace_icon_tag(m, icon_names), html)
+    html = LUCIDE_SCRIPT_RE.sub("", html)
+
+    if tailwind_css is None:
+        tailwind_css = compile_tailwind(template_file)
+    inline_css = "\n".join(font_css + [tailwind_css])
+    style_tag = f"\n    <style>{{% raw %}}\n{inline_css}\n{{% endraw %}}</style>"
+    html = TAILWIND_SCRIPT_RE.sub(lambda m: style_tag, html, count=1)
+
+    os.makedirs(BUILD_DIR, exist_ok=True)
+    output = os.path.join(BUILD_DIR, os.path.basename(template_file))
+    with open(output, "w", encoding="utf-8") as f:
+        f.write(html)
+    return output, icon_names
+
+
+def main(templates):
+    for template_file in templates:
+        print(f"Bygger {template_file}...")
+        output, icon_names = build_template(template_file)
+        for name in sorted(icon_names):
+            fetch_icon(name)
+        print(f"  -> {os.path.relpath(output, BASE_DIR)}")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:] or DEFAULT_TEMPLATES)
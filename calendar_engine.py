@@ -0,0 +1,254 @@
+import re
+import datetime
+from collections import namedtuple
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+from dateutil.rrule import rrulestr
+
+# Minimal ICS-motor för dashboarden: tolkar bara VEVENT-fälten vi visar och expanderar
+# återkommande händelser (RRULE/RDATE/EXDATE/RECURRENCE-ID) enbart inom fönstret,
+# istället för att bygga hela tidslinjen med ics.Calendar.
+
+CalendarEvent = namedtuple("CalendarEvent", ["name", "begin", "end"])
+
+DURATION_RE = re.compile(r"^([+-])?P(?:(\d+)W)?(?:(\d+)D)?(?:T(?:(\d+)H)?(?:(\d+)M)?(?:(\d+)S)?)?$")
+UNTIL_RE = re.compile(r"UNTIL=([0-9TZ]+)")
+
+# Outlook skickar ofta Windows-namn istället för IANA-zoner
+WINDOWS_ZONES = {
+    "W. Europe Standard Time": "Europe/Stockholm",
+    "Central Europe Standard Time": "Europe/Budapest",
+    "Romance Standard Time": "Europe/Paris",
+    "GMT Standard Time": "Europe/London",
+    "UTC": "UTC",
+}
+
+_zone_cache = {}
+
+
+def get_zone(tzid):
+    if tzid not in _zone_cache:
+        try:
+            _zone_cache[tzid] = ZoneInfo(WINDOWS_ZONES.get(tzid, tzid))
+        except (ZoneInfoNotFoundError, ValueError):
+            # okänd zon, tolkas som lokal tid
+            _zone_cache[tzid] = None
+    return _zone_cache[tzid]
+
+
+def unfold(text):
+    return re.sub(r"\r?\n[ \t]", "", text).splitlines()
+
+
+def split_property(line):
+    """
+    'DTSTART;TZID="x:y":20240101T100000' -> ('DTSTART', {'TZID': 'x:y'}, '20240101T100000')
+    """
+    in_quotes = False
+    for i, ch in enumerate(line):
+        if ch == '"':
+            in_quotes = not in_quotes
+        elif ch == ":" and not in_quotes:
+            head, value = line[:i], line[i + 1:]
+            break
+    else:
+        return line.upper(), {}, ""
+
+    name, *raw_params = head.split(";")
+    params = {}
+    for param in raw_params:
+        key, _, val = param.partition("=")
+        params[key.upper()] = val.strip('"')
+    return name.upper(), params, value
+
+
+def parse_datetime(value, params):
+    """
+    Returnerar (datetime, är_heldag). Tider utan zon returneras naiva (lokal tid).
+    """
+    value = value.strip()
+    if params.get("VALUE") == "DATE" or len(value) == 8:
+        return datetime.datetime.strptime(value[:8], "%Y%m%d"), True
+    if value.endswith("Z"):
+        return datetime.datetime.strptime(value[:15], "%Y%m%dT%H%M%S").replace(tzinfo=datetime.timezone.utc), False
+    dt = datetime.datetime.strptime(value[:15], "%Y%m%dT%H%M%S")
+    if "TZID" in params:
+        zone = get_zone(params["TZID"])
+        if zone:
+            dt = dt.replace(tzinfo=zone)
+    return dt, False
+
+
+def parse_duration(value):
+    match = DURATION_RE.match(value.strip())
+    if not match:
+        return None
+    sign, weeks, days, hours, minutes, seconds = match.groups()
+    delta = datetime.timedelta(
+        weeks=int(weeks or 0), days=int(days or 0),
+        hours=int(hours or 0), minutes=int(minutes or 0), seconds=int(seconds or 0),
+    )
+    return -delta if sign == "-" else delta
+
+
+def unescape(value):
+    return value.replace("\\n", " ").replace("\\N", " ").replace("\\,", ",").replace("\\;", ";").replace("\\\\", "\\")
+
+
+def parse_vevents(text):
+    """
+    Returnerar en lista med dicts för varje VEVENT, med bara fälten som används.
+    """
+    events = []
+    current = None
+    for line in unfold(text):
+        if line == "BEGIN:VEVENT":
+            current = {"exdates": [], "rdates": []}
+            continue
+        if current is None:
+            continue
+        if line == "END:VEVENT":
+            if "begin" in current:
+                events.append(current)
+            current = None
+            continue
+
+        name, params, value = split_property(line)
+        try:
+            if name == "SUMMARY":
+                current["name"] = unescape(value)
+            elif name == "UID":
+                current["uid"] = value
+            elif name == "STATUS":
+                current["status"] = value.upper()
+            elif name == "DTSTART":
+                current["begin"], current["all_day"] = parse_datetime(value, params)
+            elif name == "DTEND":
+                current["end"], _ = parse_datetime(value, params)
+            elif name == "DURATION":
+                current["duration"] = parse_duration(value)
+            elif name == "RRULE":
+                current["rrule"] = value
+            elif name == "EXDATE":
+                current["exdates"].extend(parse_datetime(v, params)[0] for v in value.split(","))
+            elif name == "RDATE" and params.get("VALUE") != "PERIOD":
+                current["rdates"].extend(parse_datetime(v, params)[0] for v in value.split(","))
+            elif name == "RECURRENCE-ID":
+                current["recurrence_id"], _ = parse_datetime(value, params)
+        except ValueError:
+            continue
+    return events
+
+
+def to_space_of(dt, reference):
+    """
+    Gör dt jämförbar med reference (båda naiva eller båda med zon).
+    """
+    if (dt.tzinfo is None) == (reference.tzinfo is None):
+        return dt
+    if dt.tzinfo is None:
+        # naiv tid tolkas som lokal tid
+        return dt.astimezone(reference.tzinfo)
+    return dt.astimezone().replace(tzinfo=None)
+
+
+def to_local(dt):
+    return dt.astimezone()
+
+
+def normalize_until(rule, dtstart):
+    """
+    dateutil kräver att UNTIL och DTSTART är samma sort (UTC resp. naiv).
+    """
+    match = UNTIL_RE.search(rule)
+    if not match:
+        return rule
+    until, _ = parse_datetime(match.group(1), {})
+    if len(match.group(1)) == 8:
+        until = until.replace(hour=23, minute=59, second=59)
+    until = to_space_of(until, dtstart)
+    if until.tzinfo is not None:
+        value = until.astimezone(datetime.timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+    else:
+        value = until.strftime("%Y%m%dT%H%M%S")
+    return rule[:match.start(1)] + value + rule[match.end(1):]
+
+
+def event_length(event):
+    if "end" in event:
+        return to_space_of(event["end"], event["begin"]) - event["begin"]
+    if event.get("duration") is not None:
+        return event["duration"]
+    return datetime.timedelta(days=1) if event.get("all_day") else datetime.timedelta(0)
+
+
+def occurrences(event, window_start, window_end):
+    """
+    Startider för händelsen som kan synas i [window_start, window_end).
+    """
+    begin = event["begin"]
+    length = event_length(event)
+    start = to_space_of(window_start, begin) - length
+    end = to_space_of(window_end, begin)
+
+    if "rrule" not in event and not event["rdates"]:
+        return [begin] if start <= begin < end else []
+
+    starts = []
+    if "rrule" in event:
+        rule = rrulestr(normalize_until(event["rrule"], begin), dtstart=begin)
+        starts.extend(rule.between(start, end, inc=True))
+    starts.extend(to_space_of(d, begin) for d in event["rdates"] if start <= to_space_of(d, begin) < end)
+
+    excluded = {to_space_of(d, begin) for d in event["exdates"]}
+    return sorted(s for s in set(starts) if s not in excluded)
+
+
+def expand_events(vevents, window_start, window_end):
+    """
+    Expanderar händelserna till CalendarEvent inom fönstret, med lokala tider.
+    window_start/window_end är naiva datetime i lokal tid.
+    """
+    overrides = set()
+    for event in vevents:
+        if "recurrence_id" in event and "uid" in event:
+            overrides.add((event["uid"], to_local(event["recurrence_id"])))
+
+    expanded = []
+    for event in vevents:
+        if event.get("status") == "CANCELLED":
+            continue
+        name = event.get("name", "")
+        length = event_length(event)
+        is_override = "recurrence_id" in event
+
+        for start in occurrences(event, window_start, window_end):
+            local_start = to_local(start)
+            if not is_override and (event.get("uid"), local_start) in overrides:
+                continue
+            expanded.append(CalendarEvent(name, local_start, to_local(start + length)))
+
+    expanded.sort(key=lambda e: e.begin)
+    return expanded
+
+
+def bucket_by_day(events, week_start, days=7):
+    """
+    Lägger händelserna per dag i ett enda svep. Returnerar en lista med en lista per dag.
+    """
+    buckets = [[] for _ in range(days)]
+    for e in events:
+        try:
+            local_start = e.begin.astimezone() if e.begin.tzinfo else e.begin
+            local_end = e.end.astimezone() if e.end.tzinfo else e.end
+        except Exception as err:
+            print(f"Kunde inte läsa eventdata för {getattr(e, 'name', 'okänt')}: {err}")
+            continue
+
+        index = (local_start.date() - week_start).days
+        if 0 <= index < days:
+            buckets[index].append({
+                'name': e.name,
+                'start': local_start.hour + (local_start.minute / 60.0),
+                'end': local_end.hour + (local_end.minute / 60.0)
+            })
+    return buckets
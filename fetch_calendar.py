@@ -1,20 +1,153 @@
-import requests
-from ics import Calendar
+import os
+import re
+import json
+import hashlib
+import datetime
+from http_session import get_session
+from calendar_engine import CalendarEvent, parse_vevents, expand_events
 
-def get_calendar_events(ics_url):
+# Varje ICS-url cachas på disk med ETag/Last-Modified och de redan tolkade händelserna
+# för veckan som visas och nästa. Ett 304-svar hoppar då över både nedladdning och tolkning.
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".calendar_cache")
+
+DATE_VALUE_RE = re.compile(r"^(DTSTART|DTEND)[^:\r\n]*:(\d{8})", re.M)
+RECURRENCE_RE = re.compile(r"^(RRULE|RDATE|RECURRENCE-ID)[;:]", re.M)
+
+
+def calendar_window(now=None):
+    """
+    Returnerar (start, slut) som datum: veckan som visas, måndag till och med söndag, och veckan
+    efter, så att händelserna redan finns när veckan byts innan kalendern hämtats igen.
+    """
+    today = (now or datetime.datetime.now()).date()
+    start = today - datetime.timedelta(days=today.weekday())
+    return start, start + datetime.timedelta(days=14)
+
+
+def event_in_window(body, start_date, end_date):
+    """
+    Snabb koll på rå VEVENT-text utan att tolka den. Återkommande händelser
+    (och undantag från dem) behålls alltid, liksom händelser utan DTSTART eller DTEND (t.ex. med
+    DURATION, som kan börja långt före fönstret), övriga bara om DTSTART/DTEND ligger nära fönstret.
+    """
+    if RECURRENCE_RE.search(body):
+        return True
+
+    dates = dict(DATE_VALUE_RE.findall(re.sub(r"\r?\n[ \t]", "", body)))
+    if "DTSTART" not in dates or "DTEND" not in dates:
+        return True
+    try:
+        begin = datetime.datetime.strptime(dates["DTSTART"], "%Y%m%d").date()
+        end = datetime.datetime.strptime(dates["DTEND"], "%Y%m%d").date()
+    except ValueError:
+        return True
+
+    # en dags marginal för tidszoner
+    slack = datetime.timedelta(days=1)
+    return begin <= end_date + slack and end >= start_date - slack
+
+
+def filter_ics_to_window(text, start_date, end_date):
+    """
+    Plockar bort VEVENT-block som inte kan synas i fönstret innan ics tolkar filen.
+    """
+    head, *blocks = text.split("BEGIN:VEVENT")
+    kept = [head]
+    for block in blocks:
+        body, sep, tail = block.partition("END:VEVENT")
+        if event_in_window(body, start_date, end_date):
+            kept.append("BEGIN:VEVENT" + body + sep + tail)
+        else:
+            kept.append(tail.lstrip("\r\n"))
+    return "".join(kept)
+
+
+def parse_events(text, start_date, end_date):
+    """
+    Tolkar bara blocken som kan synas och expanderar återkommande händelser inom fönstret.
+    """
+    vevents = parse_vevents(filter_ics_to_window(text, start_date, end_date))
+    window_start = datetime.datetime.combine(start_date, datetime.time())
+    window_end = datetime.datetime.combine(end_date, datetime.time())
+    return expand_events(vevents, window_start, window_end)
+
+
+def cache_path(url):
+    return os.path.join(CACHE_DIR, hashlib.sha1(url.encode("utf-8")).hexdigest() + ".json")
+
+
+def load_cache(url):
+    try:
+        with open(cache_path(url), encoding="utf-8") as f:
+            cached = json.load(f)
+        cached["events"] = [
+            CalendarEvent(e["name"], datetime.datetime.fromisoformat(e["begin"]), datetime.datetime.fromisoformat(e["end"]))
+            for e in cached["events"]
+        ]
+        return cached
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+def save_cache(url, etag, last_modified, start_date, events):
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    data = {
+        "url": url,
+        "etag": etag,
+        "last_modified": last_modified,
+        "window_start": start_date.isoformat(),
+        "events": [{"name": e.name, "begin": e.begin.isoformat(), "end": e.end.isoformat()} for e in events],
+    }
+    path = cache_path(url)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
+
+
+def fetch_calendar(url, start_date, end_date):
+    cached = load_cache(url)
+    if cached and cached.get("window_start") != start_date.isoformat():
+        # ny vecka, de sparade händelserna täcker inte fönstret
+        cached = None
+
+    headers = {}
+    if cached:
+        if cached.get("etag"):
+            headers["If-None-Match"] = cached["etag"]
+        if cached.get("last_modified"):
+            headers["If-Modified-Since"] = cached["last_modified"]
+
+    try:
+        response = get_session().get(url, headers=headers, timeout=20)
+        if response.status_code == 304 and cached:
+            return cached["events"]
+        response.raise_for_status()
+    except Exception as e:
+        if cached:
+            print(f"Kalender otillgänglig, använder cache: {e}")
+            return cached["events"]
+        raise
+
+    events = parse_events(response.text, start_date, end_date)
+    try:
+        save_cache(url, response.headers.get("ETag"), response.headers.get("Last-Modified"), start_date, events)
+    except OSError as e:
+        print(f"Kunde inte spara kalendercache: {e}")
+    return events
+
+
+def get_calendar_events(ics_url, now=None):
+    start_date, end_date = calendar_window(now)
     events = []
     for cal in ics_url.split(","):
-        response = requests.get(cal)
-        response.raise_for_status()
-        c = Calendar(response.text)
-        events.extend(list(c.timeline))
+        events.extend(fetch_calendar(cal.strip(), start_date, end_date))
     return events
 
 
 if __name__ == "__main__":
     from dotenv import load_dotenv
-    import os  
     load_dotenv()
     ICS_URL = os.environ.get("ICS_URL")
     result =  get_calendar_events(ICS_URL)
-    print(result)
\ No newline at end of file
+    print(result)
@@ -1,14 +1,58 @@
 import os
 import sys
+import time
+import threading
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
 import requests
 from datetime import datetime
 from requests.auth import HTTPBasicAuth
+from http_session import get_session
+from json_stream import iter_array, CHUNK_SIZE
 
 load_dotenv()
 
 
-def get_access_token(client_id=None, secret=None):
+# förnya token så här många sekunder innan den går ut
+TOKEN_REFRESH_MARGIN = 60
+
+# Sekunder mellan anropen till Västtrafik. Minuterna räknas om lokalt varje minut, så
+# API:t frågas DEPARTURES_POLL_MIN när en avgång är högst DEPARTURES_NEAR_MINUTES bort
+# eller en försening ändrats, annars först när nästa avgång närmar sig, högst DEPARTURES_POLL_MAX.
+DEPARTURES_POLL_MIN = int(os.environ.get("DEPARTURES_POLL_MIN", 120))
+DEPARTURES_POLL_MAX = int(os.environ.get("DEPARTURES_POLL_MAX", 900))
+DEPARTURES_NEAR_MINUTES = int(os.environ.get("DEPARTURES_NEAR_MINUTES", 3))
+# en beräknad tid som flyttats minst så här många sekunder sedan förra anropet är en ändrad försening
+DELAY_CHANGE_S = 60
+# avgångar som gick för mer än så här många sekunder sedan tas bort från tavlan
+DEPARTED_GRACE_S = 30
+# hållplatser vars nästa anrop ligger inom så här många sekunder frågas i samma omgång,
+# hämtningen körs vid varje hel minut
+POLL_SLACK_S = 60
+
+# rader på tavlan per hållplats, och avgångar per rad (nästa och senare)
+BOARD_ROWS = 5
+ROW_DEPARTURES = 2
+# vad som efterfrågas: tavlan behöver bara de närmaste avgångarna per linje och riktning,
+# och svaret läses bara tills raderna är fyllda
+DEPARTURES_LIMIT = 40
+DEPARTURES_TIME_SPAN = 120
+DEPARTURES_PER_LINE = 3
+# tavlan ska vara komplett så här långt fram, fram till nästa anrop även om ett missas
+READ_HORIZON_S = 2 * DEPARTURES_POLL_MIN + DEPARTED_GRACE_S
+
+# en avgång med bara de fält tavlan använder
+Departure = namedtuple("Departure", ["journey", "key", "line", "destination", "via", "platform", "estimated_time", "cancelled"])
+
+_token_cache = {"access_token": None, "expires_at": 0}
+_token_lock = threading.Lock()
+
+
+def request_access_token(client_id=None, secret=None):
+    """
+    Hämtar en ny token. Returnerar (access_token, expires_in).
+    """
     client_id = client_id or os.environ.get("VASTTRAFIK_API_KEY")
     secret = secret or os.environ.get("VASTTRAFIK_SECRET")
     
@@ -21,26 +65,127 @@ def get_access_token(client_id=None, secret=None):
     data = {"grant_type": "client_credentials"}
     
     try:
-        r = requests.post(url, headers=headers, data=data, auth=auth, timeout=10)
+        r = get_session().post(url, headers=headers, data=data, auth=auth, timeout=10)
         r.raise_for_status()
-        return r.json()["access_token"]
+        token_data = r.json()
+        return token_data["access_token"], int(token_data.get("expires_in", 0))
     except Exception as e:
         raise RuntimeError(f"Kunde inte hämta token: {e}")
 
-def get_departures(access_token, stop_area_gid, time_span_in_minutes=180):
+def get_access_token(client_id=None, secret=None, force_refresh=False):
+    """
+    Returnerar en cachad token och hämtar en ny först när den snart går ut.
+    """
+    with _token_lock:
+        now = time.time()
+        if not force_refresh and _token_cache["access_token"] and now < _token_cache["expires_at"]:
+            return _token_cache["access_token"]
+
+        token, expires_in = request_access_token(client_id, secret)
+        _token_cache["access_token"] = token
+        _token_cache["expires_at"] = now + max(0, expires_in - TOKEN_REFRESH_MARGIN)
+        return token
+
+def invalidate_access_token(token=None):
+    """
+    Glömmer den cachade token. Med token bara om det fortfarande är den, så att flera
+    anrop som fått 401 på samma token inte hämtar varsin ny.
+    """
+    with _token_lock:
+        if token is not None and _token_cache["access_token"] != token:
+            return
+        _token_cache["access_token"] = None
+        _token_cache["expires_at"] = 0
+
+def get_departures(access_token, stop_area_gid, time_span_in_minutes=DEPARTURES_TIME_SPAN, limit=DEPARTURES_LIMIT):
+    """
+    Startar anropet och returnerar svaret utan att läsa det, read_departures läser det medan det kommer.
+    """
     url = f"https://ext-api.vasttrafik.se/pr/v4/stop-areas/{stop_area_gid}/departures"
     headers = {'Authorization': f'Bearer {access_token}'}
     
     params = {
         "timeSpanInMinutes": time_span_in_minutes,
-        "maxDeparturesPerLineAndDirection": 4, 
-        "limit": 80,
+        "maxDeparturesPerLineAndDirection": DEPARTURES_PER_LINE, 
+        "limit": limit,
         "offset": 0,
         "includeOccupancy": False,
     }
-    response = requests.get(url, headers=headers, params=params)
+    response = get_session().get(url, headers=headers, params=params, timeout=10, stream=True)
+    if not response.ok:
+        response.close()
     response.raise_for_status()
-    return response.json()
+    return response
+
+def project_departure(item):
+    """
+    Plockar ut tavlans fält ur en avgång i svaret.
+    Returnerar (Departure, hållplatsnamn).
+    """
+    stop_point = item['stopPoint']
+    planned_str = item['plannedTime']
+    estimated_str = item.get('estimatedTime') or planned_str
+
+    service = item['serviceJourney']
+    line_name = service['line']['shortName']
+    direction = service['directionDetails']
+    destination = direction['shortDirection']
+    via = direction.get('via')
+
+    departure = Departure(
+        # samma tur har samma id på alla hållplatser den passerar
+        journey=service.get('gid') or item.get('detailsReference') or f"{line_name} {planned_str}",
+        key=(line_name, destination, via),
+        line=line_name,
+        destination=destination,
+        via=via,
+        platform=stop_point.get('platform', '?'),
+        estimated_time=datetime.fromisoformat(estimated_str),
+        cancelled=item.get('isCancelled', False),
+    )
+    return departure, stop_point['name']
+
+def read_departures(response, filter_platforms=None, rows=BOARD_ROWS, horizon_s=READ_HORIZON_S):
+    """
+    Läser avgångarna ur svaret medan det kommer, i tidsordning, och slutar när tavlan
+    är komplett horizon_s sekunder fram: varje linje och riktning som har en avgång
+    före dess, och minst rows totalt, har ROW_DEPARTURES avgångar därefter. En linje
+    som dyker upp först när rows andra redan har en avgång efter horisonten hamnar
+    under dem på tavlan hela tiden fram till dess och behövs inte.
+    Returnerar en tuple: (lista_med_avgångar, hållplatsnamn)
+    """
+    horizon = time.time() + horizon_s
+    departures = []
+    stop_name = None
+    # grupp -> antal avgångar efter horisonten, för grupperna som måste fyllas
+    needed = {}
+
+    with response:
+        items = iter_array(response.iter_content(CHUNK_SIZE), 'results')
+        for item in items:
+            dep, raw_name = project_departure(item)
+            if stop_name is None:
+                stop_name = raw_name.replace(", Göteborg", "").strip()
+            if filter_platforms and dep.platform not in filter_platforms:
+                continue
+            departures.append(dep)
+
+            if dep.estimated_time.timestamp() < horizon:
+                needed.setdefault(dep.key, 0)
+                continue
+            if dep.key not in needed:
+                if sum(1 for count in needed.values() if count) >= rows:
+                    continue
+                needed[dep.key] = 0
+            needed[dep.key] += 1
+            if len(needed) >= rows and min(needed.values()) >= ROW_DEPARTURES:
+                items.close()
+                # resten läses utan att avkodas, så att anslutningen kan återanvändas
+                for _ in response.iter_content(CHUNK_SIZE):
+                    pass
+                break
+
+    return departures, stop_name
 
 def format_time(dep_obj):
     """
@@ -61,83 +206,76 @@ def format_time(dep_obj):
     else:
         return dep_obj['abs_time']
     
-def extract_board_data(stop_area_gid, filter_platforms=None):
+def fetch_departures(stop_area_gid, filter_platforms=None):
     """
+    Hämtar avgångarna med deras absoluta tider, så att minuterna kan räknas om lokalt.
     Returnerar en tuple: (lista_med_avgångar, hållplatsnamn)
     """
-    token = get_access_token()
-    api_response = get_departures(token, stop_area_gid)
-    now = datetime.now().astimezone()
-    
     # om flera platformar på samma gid men vill endast visa en
     if isinstance(filter_platforms, str): 
         filter_platforms = [filter_platforms]
 
-    stop_name = None
-    if api_response.get('results'):
-        raw_name = api_response['results'][0]['stopPoint']['name']
+    token = get_access_token()
+    try:
+        response = get_departures(token, stop_area_gid)
+    except requests.HTTPError as e:
+        if e.response is None or e.response.status_code != 401:
+            raise
+        # token återkallad eller utgången i förtid, försök en gång till med en ny
+        invalidate_access_token(token)
+        token = get_access_token()
+        response = get_departures(token, stop_area_gid)
 
-        stop_name = raw_name.replace(", Göteborg", "").strip()
+    return read_departures(response, filter_platforms)
 
+def build_board(raw_departures, now=None):
+    """
+    Grupperar avgångarna till tavlans rader med minuterna räknade mot now
+    (t.ex. nästa hela minut när bilden ritas i förväg). En tur som finns flera gånger
+    (från flera hållplatser) visas bara med den första som inte redan gått.
+    """
+    if now is None:
+        now = datetime.now()
+    now = now.astimezone()
 
-    raw_departures = []
+    grouped_data = {}
+    seen_journeys = set()
+    
+    for dep in raw_departures:
+        estimated_time = dep.estimated_time
 
-    for item in api_response.get('results', []):
-        stop_point = item['stopPoint']
-        platform = stop_point.get('platform', '?')
-        if filter_platforms and platform not in filter_platforms:
+        seconds_left = (estimated_time - now).total_seconds()
+        if seconds_left < -DEPARTED_GRACE_S or dep.journey in seen_journeys:
             continue
-
-        planned_str = item['plannedTime']
-        estimated_str = item.get('estimatedTime') or planned_str
-        estimated_time = datetime.fromisoformat(estimated_str)
-
-        minutes_left = int((estimated_time - now).total_seconds() / 60)
+        seen_journeys.add(dep.journey)
+        minutes_left = int(seconds_left / 60)
         if minutes_left < 0: minutes_left = 0
         
         abs_time_str = estimated_time.strftime("%H:%M")
 
         departure_obj = {
+            "estimated_time": estimated_time,
             "minutes": minutes_left,
             "abs_time": abs_time_str,
-            "cancelled": item.get('isCancelled', False),
-            "platform": platform
+            "cancelled": dep.cancelled,
+            "platform": dep.platform
         }
 
-        service = item['serviceJourney']
-        line_name = service['line']['shortName']
-        destination = service['directionDetails']['shortDirection']
-        via = service['directionDetails'].get('via')
-        
-        group_key = (line_name, destination, via)
-
-        raw_departures.append({
-            "key": group_key,
-            "line": line_name,
-            "destination": destination,
-            "via": via,
-            "platform": platform,
-            "data": departure_obj
-        })
-
-    grouped_data = {}
-    
-    for dep in raw_departures:
-        key = dep['key']
+        key = dep.key
         if key not in grouped_data:
-            display_dest = dep['destination']
+            display_dest = dep.destination
             grouped_data[key] = {
-                "line": dep['line'],
+                "line": dep.line,
                 "destination": display_dest,
-                "platform": dep['platform'],
+                "platform": dep.platform,
                 "departures": []
             }
-        grouped_data[key]['departures'].append(dep['data'])
+        grouped_data[key]['departures'].append(departure_obj)
     
     board_rows = []
     
     for key, group in grouped_data.items():
-        sorted_deps = sorted(group['departures'], key=lambda x: x['minutes'])
+        sorted_deps = sorted(group['departures'], key=lambda x: x['estimated_time'])
         
         next_dep = sorted_deps[0] if len(sorted_deps) > 0 else None
         after_dep = sorted_deps[1] if len(sorted_deps) > 1 else None
@@ -163,16 +301,148 @@ def extract_board_data(stop_area_gid, filter_platforms=None):
         return (x['sort_time'], line_num)
 
     board_rows.sort(key=sort_logic)
-    board_rows = board_rows[:5]
-    return board_rows, stop_name
+    board_rows = board_rows[:BOARD_ROWS]
+    return board_rows
+
+def parse_stops(value, default_platforms=None):
+    """
+    Läser STOP_AREA_GID: en eller flera hållplatser med komma emellan, var och en med
+    egna plattformar efter kolon, t.ex. "9021014002090000:A/B,9021014001960000".
+    Hållplatser utan egna plattformar får default_platforms (DEPARTURE_PLATFORM).
+    Returnerar en lista med (gid, plattformar).
+    """
+    stops = []
+    for entry in (value or "").split(","):
+        gid, _, platforms = entry.strip().partition(":")
+        if not gid:
+            continue
+        platforms = [p.strip() for p in platforms.split("/") if p.strip()]
+        stops.append((gid, platforms or default_platforms))
+    return stops
+
+class StopDepartures:
+    """
+    Senast hämtade avgångar för en hållplats, med absoluta tider och egen färskhet.
+    """
+
+    def __init__(self, gid, platforms=None):
+        self.gid = gid
+        self.platforms = platforms
+        self.departures = []
+        self.stop_name = None
+        self.fetched_at = None
+        self.next_poll = 0
+        self.delay_changed = False
+
+    def update(self, raw_departures, stop_name):
+        previous = {dep.journey: dep.estimated_time for dep in self.departures}
+        self.delay_changed = any(
+            abs((dep.estimated_time - previous[dep.journey]).total_seconds()) >= DELAY_CHANGE_S
+            for dep in raw_departures if dep.journey in previous
+        )
+        self.departures = raw_departures
+        self.stop_name = stop_name or self.stop_name
+        self.fetched_at = time.time()
+
+    def poll_interval(self, poll_min, poll_max, near_minutes, now=None):
+        """
+        Sekunder till nästa anrop: poll_min när en avgång är högst near_minutes bort eller
+        en försening just ändrats, annars tills första avgången är så nära, högst poll_max.
+        """
+        if self.fetched_at is None or self.delay_changed:
+            return poll_min
+        now = (now or datetime.now()).astimezone()
+        upcoming = [(dep.estimated_time - now).total_seconds() for dep in self.departures if not dep.cancelled]
+        upcoming = [seconds for seconds in upcoming if seconds > 0]
+        if not upcoming:
+            return poll_max
+        return max(poll_min, min(poll_max, min(upcoming) - near_minutes * 60))
+
+class DepartureCache:
+    """
+    Senast hämtade avgångar för en eller flera hållplatser. Tavlan slås ihop och räknas om
+    lokalt för varje bild. Varje hållplats frågas igen när dess egen poll_interval gått,
+    fetch() frågar de som står på tur samtidigt och poll_interval() säger när nästa gör det.
+    """
+
+    def __init__(self, stops, poll_min=DEPARTURES_POLL_MIN, poll_max=DEPARTURES_POLL_MAX, near_minutes=DEPARTURES_NEAR_MINUTES):
+        self.stops = [StopDepartures(gid, platforms) for gid, platforms in stops]
+        self.poll_min = poll_min
+        self.poll_max = poll_max
+        self.near_minutes = near_minutes
+
+    @property
+    def stop_name(self):
+        names = [stop.stop_name for stop in self.stops if stop.stop_name]
+        return " / ".join(dict.fromkeys(names)) or None
+
+    def due(self, now=None):
+        """Hållplatserna vars nästa anrop ligger inom POLL_SLACK_S."""
+        now = now or time.time()
+        return [stop for stop in self.stops if stop.next_poll <= now + POLL_SLACK_S]
+
+    def fetch(self):
+        """
+        Frågar hållplatserna som står på tur, samtidigt och över samma token och session.
+        Körs i bakgrunden och ändrar inget, svaren läggs in med update().
+        Returnerar en lista med (hållplats, (avgångar, hållplatsnamn)). En hållplats som
+        inte svarar hoppas över och frågas igen vid nästa hämtning, fel bara om ingen svarar.
+        """
+        stops = self.due()
+        if not stops:
+            return []
+        # token hämtas en gång innan anropen, inte av varje tråd för sig
+        get_access_token()
+
+        def fetch_stop(stop):
+            try:
+                return stop, fetch_departures(stop.gid, stop.platforms), None
+            except Exception as e:
+                return stop, None, e
+
+        if len(stops) == 1:
+            results = [fetch_stop(stops[0])]
+        else:
+            with ThreadPoolExecutor(max_workers=len(stops), thread_name_prefix="departures") as pool:
+                results = list(pool.map(fetch_stop, stops))
+
+        errors = [(stop, e) for stop, _, e in results if e is not None]
+        if len(errors) == len(results):
+            raise errors[0][1]
+        for stop, e in errors:
+            print(f"Bussdatafel {stop.stop_name or stop.gid}: {e}")
+        return [(stop, result) for stop, result, e in results if e is None]
+
+    def update(self, results):
+        for stop, (raw_departures, stop_name) in results:
+            stop.update(raw_departures, stop_name)
+            stop.next_poll = stop.fetched_at + stop.poll_interval(self.poll_min, self.poll_max, self.near_minutes)
+
+    def board(self, now=None):
+        # i hållplatsernas ordning, så att en tur som passerar flera visas från den första
+        return build_board([dep for stop in self.stops for dep in stop.departures], now)
+
+    def poll_interval(self):
+        """Sekunder tills nästa hållplats ska frågas igen."""
+        if not self.stops:
+            return self.poll_max
+        return max(0, min(stop.next_poll for stop in self.stops) - time.time())
+
+def extract_board_data(stop_area_gid, filter_platforms=None, now=None):
+    """
+    Returnerar en tuple: (lista_med_avgångar, hållplatsnamn)
+    """
+    raw_departures, stop_name = fetch_departures(stop_area_gid, filter_platforms)
+    return build_board(raw_departures, now), stop_name
 
 if __name__ == "__main__":
     TEST_GID = "9021014001960000" 
-    access_token = get_access_token()
     STOP_AREA_GID = os.environ.get("STOP_AREA_GID")
-    departures = get_departures(access_token,STOP_AREA_GID)
+    departures, stop_name = fetch_departures(STOP_AREA_GID)
     
-    print(departures)
+    print(stop_name)
+    for departure in departures:
+        print(departure)
     
     
     
\ No newline at end of file
@@ -1,7 +1,9 @@
 import os
+import threading
 import spotipy
 from spotipy.oauth2 import SpotifyOAuth
 from dotenv import load_dotenv
+from http_session import create_session
 
 
 load_dotenv()
@@ -9,17 +11,32 @@ client_id = os.environ.get("SPOTIFY_CLIENT_ID")
 client_secret = os.environ.get("SPOTIFY_CLIENT_SECRET")
 redirect_uri = os.environ.get("SPOTIFY_REDIRECT_URI")
 
+# Klienten skapas en gång. spotipy stänger sin session när klienten städas bort, så den får
+# en egen session och inte den delade från http_session.
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    global _client
+    with _client_lock:
+        if _client is None:
+            session = create_session()
+            auth_manager = SpotifyOAuth(
+                scope="user-read-currently-playing",
+                cache_path=".spotify_cache",
+                open_browser=False,
+                client_id=client_id,
+                client_secret=client_secret,
+                redirect_uri=redirect_uri,
+                requests_session=session
+            )
+            _client = spotipy.Spotify(auth_manager=auth_manager, requests_session=session)
+        return _client
+
 def get_spotify_data():
     try:
-        auth_manager = SpotifyOAuth(
-            scope="user-read-currently-playing",
-            cache_path=".spotify_cache",
-            open_browser=False,
-            client_id=client_id,
-            client_secret=client_secret,
-            redirect_uri=redirect_uri
-        )
-        sp = spotipy.Spotify(auth_manager=auth_manager)
+        sp = get_client()
 
         current = sp.current_user_playing_track()
 
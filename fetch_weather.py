@@ -1,5 +1,5 @@
-import requests
 import os
+from http_session import get_session
 from dotenv import load_dotenv
 load_dotenv()
 
@@ -9,7 +9,8 @@ LONGITUDE = os.environ.get("LONGITUDE")
 def fetch_weather_data(lat,lon):
     url = f"https://opendata-download-metfcst.smhi.se/api/category/pmp3g/version/2/geotype/point/lon/{lon}/lat/{lat}/data.json"
     
-    response = requests.get(url)
+    response = get_session().get(url, timeout=10)
+    response.raise_for_status()
     data = response.json()
     
     params = data['timeSeries'][0]['parameters']
@@ -0,0 +1,139 @@
+# rutnät som ändringarna grupperas i: 4 byte (32 px) brett och 16 rader högt
+TILE_BYTES = 4
+TILE_ROWS = 16
+
+
+class FrameDiffer:
+    """
+    Håller den senast visade 1-bitsbufferten och räknar hur många pixlar
+    en ny buffert skiljer sig med, så att oförändrade bilder aldrig skickas till skärmen.
+    """
+
+    def __init__(self):
+        self.last_buffer = None
+
+    def changed_pixels(self, buffer):
+        """
+        Antal pixlar som ändrats sedan förra visade bilden, eller None om ingen bild visats än.
+        """
+        if self.last_buffer is None or len(self.last_buffer) != len(buffer):
+            return None
+        diff = int.from_bytes(self.last_buffer, "big") ^ int.from_bytes(bytes(buffer), "big")
+        return diff.bit_count()
+
+    def changed_regions(self, buffer, width, height, max_regions=2):
+        """
+        Rektanglar (x0, y0, x1, y1) i panelens koordinater som täcker alla ändrade pixlar.
+        x0/x1 ligger på hela byte (8 px) som kontrollern kräver, x1 och y1 är exklusiva.
+        Returnerar None om ingen bild visats än.
+        """
+        if self.last_buffer is None or len(self.last_buffer) != len(buffer):
+            return None
+
+        row_bytes = width // 8
+        tiles_x = (row_bytes + TILE_BYTES - 1) // TILE_BYTES
+        tiles_y = (height + TILE_ROWS - 1) // TILE_ROWS
+        new = bytes(buffer)
+        old = self.last_buffer
+
+        dirty = set()
+        for y in range(height):
+            start = y * row_bytes
+            old_row = old[start:start + row_bytes]
+            new_row = new[start:start + row_bytes]
+            if old_row == new_row:
+                continue
+            for tx in range(tiles_x):
+                b0 = tx * TILE_BYTES
+                if old_row[b0:b0 + TILE_BYTES] != new_row[b0:b0 + TILE_BYTES]:
+                    dirty.add((tx, y // TILE_ROWS))
+
+        boxes = [self._refine(box, old, new, row_bytes, height) for box in tile_components(dirty, tiles_x, tiles_y)]
+        boxes = merge_boxes(boxes, max_regions)
+        return [(bx0 * 8, y0, bx1 * 8, y1) for bx0, y0, bx1, y1 in boxes]
+
+    @staticmethod
+    def _refine(box, old, new, row_bytes, height):
+        """
+        Krymper en rektangel i rutor till exakta byte/rader.
+        """
+        tx0, ty0, tx1, ty1 = box
+        bx0, bx1 = tx0 * TILE_BYTES, min(row_bytes, tx1 * TILE_BYTES)
+        first_byte, last_byte, first_row, last_row = bx1, bx0, None, None
+        for y in range(ty0 * TILE_ROWS, min(height, ty1 * TILE_ROWS)):
+            start = y * row_bytes
+            for b in range(bx0, bx1):
+                if old[start + b] != new[start + b]:
+                    first_byte = min(first_byte, b)
+                    last_byte = max(last_byte, b)
+                    if first_row is None:
+                        first_row = y
+                    last_row = y
+        return first_byte, first_row, last_byte + 1, last_row + 1
+
+    def update(self, buffer):
+        self.last_buffer = bytes(buffer)
+
+    def reset(self):
+        self.last_buffer = None
+
+
+def tile_components(dirty, tiles_x, tiles_y):
+    """
+    Slår ihop angränsande ändrade rutor (även diagonalt) till omslutande rektanglar i rutor.
+    """
+    boxes = []
+    seen = set()
+    for tile in sorted(dirty):
+        if tile in seen:
+            continue
+        seen.add(tile)
+        stack = [tile]
+        x0, y0, x1, y1 = tile[0], tile[1], tile[0] + 1, tile[1] + 1
+        while stack:
+            tx, ty = stack.pop()
+            x0, y0, x1, y1 = min(x0, tx), min(y0, ty), max(x1, tx + 1), max(y1, ty + 1)
+            for nx in (tx - 1, tx, tx + 1):
+                for ny in (ty - 1, ty, ty + 1):
+                    neighbour = (nx, ny)
+                    if neighbour in dirty and neighbour not in seen:
+                        seen.add(neighbour)
+                        stack.append(neighbour)
+        boxes.append((x0, y0, x1, y1))
+    return boxes
+
+
+def box_area(box):
+    return (box[2] - box[0]) * (box[3] - box[1])
+
+
+def union_box(a, b):
+    return min(a[0], b[0]), min(a[1], b[1]), max(a[2], b[2]), max(a[3], b[3])
+
+
+def overlaps(a, b):
+    return a[0] < b[2] and b[0] < a[2] and a[1] < b[3] and b[1] < a[3]
+
+
+def merge_boxes(boxes, max_regions):
+    """
+    Varje fönster kostar en egen uppdatering av panelen, så rektanglarna slås ihop
+    parvis (det par som ger minst extra yta först) tills de är högst max_regions och inte överlappar.
+    """
+    boxes = list(boxes)
+    while len(boxes) > 1:
+        best = None
+        for i in range(len(boxes)):
+            for j in range(i + 1, len(boxes)):
+                merged = union_box(boxes[i], boxes[j])
+                cost = box_area(merged) - box_area(boxes[i]) - box_area(boxes[j])
+                if overlaps(boxes[i], boxes[j]):
+                    cost = -1
+                if best is None or cost < best[0]:
+                    best = (cost, i, j, merged)
+        if len(boxes) <= max_regions and best[0] >= 0:
+            break
+        _, i, j, merged = best
+        boxes = [b for k, b in enumerate(boxes) if k not in (i, j)] + [merged]
+    return boxes
+
@@ -0,0 +1,58 @@
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# Gemensam requests-session för alla fetch_*-moduler, så att TCP/TLS-anslutningarna
+# till Västtrafik, SMHI och kalendervärdarna återanvänds mellan varven.
+
+# (anslutning, läsning) i sekunder, används när anroparen inte anger egen timeout
+DEFAULT_TIMEOUT = (5, 15)
+POOL_SIZE = 8
+
+RETRY = Retry(
+    total=2,
+    connect=2,
+    read=1,
+    backoff_factor=0.5,
+    status_forcelist=(429, 500, 502, 503, 504),
+    allowed_methods=frozenset({"GET", "HEAD", "POST"}),
+    respect_retry_after_header=True,
+    raise_on_status=False,
+)
+
+_session = None
+_session_lock = threading.Lock()
+
+
+class TimeoutSession(requests.Session):
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault("timeout", DEFAULT_TIMEOUT)
+        return super().request(method, url, **kwargs)
+
+
+def create_session():
+    session = TimeoutSession()
+    adapter = HTTPAdapter(pool_connections=POOL_SIZE, pool_maxsize=POOL_SIZE, max_retries=RETRY)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def get_session():
+    """
+    Returnerar den delade sessionen, skapas vid första anropet.
+    """
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = create_session()
+        return _session
+
+
+def close_session():
+    global _session
+    with _session_lock:
+        if _session is not None:
+            _session.close()
+            _session = None
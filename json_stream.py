@@ -0,0 +1,97 @@
+import codecs
+import json
+import re
+
+# Läser ett JSON-svar medan det kommer, så att en lång lista aldrig finns i minnet
+# på en gång och läsningen kan avbrytas när man fått det man behöver.
+
+CHUNK_SIZE = 8192
+
+_decoder = json.JSONDecoder()
+_WHITESPACE = " \t\n\r"
+_NUMBER_TAIL = re.compile(r"[0-9.eE+-]*")
+
+
+class _Reader:
+    def __init__(self, chunks):
+        self.chunks = iter(chunks)
+        self.utf8 = codecs.getincrementaldecoder("utf-8")()
+        self.buf = ""
+        self.pos = 0
+        self.eof = False
+
+    def more(self):
+        """Läser nästa bit av svaret. Returnerar False när det är slut."""
+        if self.eof:
+            return False
+        for chunk in self.chunks:
+            if chunk:
+                self.buf = self.buf[self.pos:] + self.utf8.decode(chunk)
+                self.pos = 0
+                return True
+        self.buf = self.buf[self.pos:] + self.utf8.decode(b"", final=True)
+        self.pos = 0
+        self.eof = True
+        return False
+
+    def peek(self):
+        """Nästa tecken som inte är blanksteg, "" när svaret är slut."""
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in _WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self.more():
+                return ""
+
+    def expect(self, char):
+        if self.peek() != char:
+            raise ValueError(f"Felaktig JSON: väntade {char!r}, fick {self.peek()!r}")
+        self.pos += 1
+
+    def value(self):
+        """Avkodar nästa värde, läser mer tills det är helt."""
+        self.peek()
+        while True:
+            try:
+                value, end = _decoder.raw_decode(self.buf, self.pos)
+            except json.JSONDecodeError:
+                if not self.more():
+                    raise
+                continue
+            # ett tal som går ända till buffertens slut kan fortsätta i nästa bit, även när
+            # avkodaren stannat före en avslutande punkt, exponent eller ett tecken
+            if isinstance(value, (int, float)) and _NUMBER_TAIL.fullmatch(self.buf, end) and self.more():
+                continue
+            self.pos = end
+            return value
+
+
+def iter_array(chunks, key):
+    """
+    Ger elementen i arrayen key i ett JSON-objekt ett i taget, medan chunks (bytes,
+    t.ex. response.iter_content()) läses. Fält före key avkodas och kastas, det som
+    kommer efter arrayen läses inte. Generatorn kan avbrytas när som helst.
+    """
+    reader = _Reader(chunks)
+    reader.expect("{")
+    if reader.peek() == "}":
+        return
+    while True:
+        name = reader.value()
+        reader.expect(":")
+        if name == key:
+            reader.expect("[")
+            if reader.peek() == "]":
+                return
+            while True:
+                yield reader.value()
+                if reader.peek() != ",":
+                    reader.expect("]")
+                    return
+                reader.pos += 1
+        reader.value()
+        if reader.peek() != ",":
+            reader.expect("}")
+            return
+        reader.pos += 1
@@ -0,0 +1,46 @@
+import os
+from functools import lru_cache
+from markupsafe import Markup
+
+# Lokala resurser som build_assets.py har laddat ner, används av de byggda mallarna i build/.
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+ICON_DIR = os.path.join(BASE_DIR, "assets", "icons")
+BUILD_DIR = os.path.join(BASE_DIR, "build")
+
+
+@lru_cache(maxsize=None)
+def _read_icon(name):
+    path = os.path.join(ICON_DIR, f"{name}.svg")
+    try:
+        with open(path, encoding="utf-8") as f:
+            return f.read().strip()
+    except OSError:
+        print(f"Ikon saknas: {path} (kör build_assets.py)")
+        return ""
+
+
+def lucide_icon(name, css_class=""):
+    """
+    Returnerar Lucide-ikonen som inline-svg med samma klasser som lucide.createIcons() sätter.
+    """
+    svg = _read_icon(name)
+    if not svg:
+        return Markup("")
+    classes = f"lucide lucide-{name} {css_class}".strip()
+    return Markup(svg.replace("<svg", f'<svg class="{classes}"', 1))
+
+
+def template_path(name):
+    """
+    Föredrar den byggda offline-mallen i build/ om den finns.
+    """
+    built = os.path.join("build", os.path.basename(name))
+    if os.path.exists(os.path.join(BASE_DIR, built)):
+        return built
+    return name
+
+
+def register(env):
+    env.globals["lucide_icon"] = lucide_icon
+    return env
@@ -3,14 +3,21 @@ import os
 import time
 import datetime
 import traceback
+import io
 from PIL import Image
 from jinja2 import Environment, FileSystemLoader
 from dotenv import load_dotenv
-from fetch_departure_info import extract_board_data
+from fetch_departure_info import DepartureCache, parse_stops
 from fetch_calendar import get_calendar_events
+from calendar_engine import bucket_by_day
 from fetch_weather import fetch_weather_data
 from fetch_spotify import get_spotify_data
-from playwright.sync_api import sync_playwright
+from scheduler import Scheduler, Job
+from http_session import close_session
+from frame_diff import FrameDiffer
+from render_pillow import render_dashboard
+import local_assets
+from waveshare_epd import epdconfig, panels
 
 
 # PI:
@@ -25,13 +32,56 @@ DISPLAY_WIDTH = 480
 DISPLAY_HEIGHT = 800
 
 load_dotenv()
+# en eller flera hållplatser, t.ex. 9021014002090000:A/B,9021014001960000 (plattformar efter kolon)
 STOP_AREA_GID = os.environ.get("STOP_AREA_GID")
 ICS_URL = os.environ.get("ICS_URL")
 LONGITUDE = os.environ.get("LONGITUDE")
 LATITUDE = os.environ.get("LATITUDE")
 platform = os.environ.get("DEPARTURE_PLATFORM")
+# "playwright" (html + chromium) eller "pillow" (ritar direkt utan browser)
+RENDER_BACKEND = os.environ.get("RENDER_BACKEND", "playwright").lower()
+# ZERO_DISK=1: html och skärmdump stannar i minnet, inget skrivs till SD-kortet
+ZERO_DISK = os.environ.get("ZERO_DISK", "0") == "1"
+# WARM_PAGE=1: sidan laddas en gång, sedan patchas bara ändrade regioner via window.updateDashboard
+WARM_PAGE = os.environ.get("WARM_PAGE", "0") == "1"
+# jinja-block i dashboard.html -> element-id som blocket ligger i
+WARM_PAGE_REGIONS = {
+    "datum": "region-datum",
+    "huvud": "region-huvud",
+    "hallplats": "region-hallplats",
+    "avgangar": "region-avgangar",
+}
 DATA_FETCH_INTERVAL = 300
 CALENDAR_FETCH_INTERVAL = 3600
+HTML_FILENAME = "renderad_sida.html"
+IMAGE_FILENAME = "display_buffer.png"
+# sekunder före minutskiftet som nästa minuts bild ritas, så att den är klar att skicka till skärmen
+RENDER_LEAD = 3 if RENDER_BACKEND == "pillow" else 10
+# sekunder varje källa får på sig innan bilden ritas utan den
+FETCH_TIMEOUTS = {
+    "departures": 10,
+    "spotify": 5,
+    "calendar": 20,
+    "weather": 10,
+}
+
+
+# SPI-klocka (Hz) och största överföring (byte) för panelen, tom = drivrutinens standard.
+# Snabbaste stabila klockan tas fram med: python -m waveshare_epd.spi_selftest <drivrutin>
+EPD_SPI_SPEED_HZ = os.environ.get("EPD_SPI_SPEED_HZ") or None
+EPD_SPI_CHUNK_SIZE = os.environ.get("EPD_SPI_CHUNK_SIZE") or None
+# EPD_PANEL=epd7in5_V2: panelens drivrutin, i stället för epd_driver ovan
+EPD_PANEL = os.environ.get("EPD_PANEL")
+# EPD_SIMULATE=epd7in5_V2: kör drivrutinen mot en simulerad panel utan hårdvara
+# (samma kommandon, byte och uppdateringstider som den riktiga), när ingen panel är satt
+EPD_SIMULATE = os.environ.get("EPD_SIMULATE")
+
+
+# byt till helskärmsuppdatering (den snabba om panelen har en) om minst så här stor andel av pixlarna ändrats
+FULL_REFRESH_CHANGED_RATIO = 0.5
+REFRESH_MODE_NAMES = {"partial": "Delvis", "fast": "Snabb", "full": "Full", "gray": "Gråskale"}
+# max antal fönster per delvis uppdatering, varje fönster är en egen uppdatering av panelen
+MAX_PARTIAL_REGIONS = 2
 
 
 NIGHT_MODE_START = 3
@@ -42,47 +92,27 @@ NIGHT_MODE_SLEEP = 300
 playwright_instance = None
 browser_instance = None
 page_instance = None
+warm_state = None
 
-def prepare_calendar_data(events):
+def prepare_calendar_data(events, now=None):
     week_view = []
-    now = datetime.datetime.now()
+    now = now or datetime.datetime.now()
     today_date = now.date()
     
     start_of_week = today_date - datetime.timedelta(days=today_date.weekday())
     
     dagar_korta = ['M', 'T', 'O', 'T', 'F', 'L', 'S']
 
+    buckets = bucket_by_day(events or [], start_of_week)
+
     for i in range(7):
         target_date = start_of_week + datetime.timedelta(days=i)
         
-        day_struct = {
+        week_view.append({
             'namn': dagar_korta[i],
-            'events': [],
+            'events': buckets[i],
             'is_today': (target_date == today_date)
-        }
-        
-        if events:
-            for e in events:
-                try:
-                    if hasattr(e.begin, 'to'):
-                        local_start = e.begin.to('local')
-                        local_end = e.end.to('local')
-                    else:
-                        local_start = e.begin.astimezone() if e.begin.tzinfo else e.begin
-                        local_end = e.end.astimezone() if e.end.tzinfo else e.end
-
-                    if local_start.date() == target_date:
-                        day_struct['events'].append({
-                            'name': e.name,
-                            'start': local_start.hour + (local_start.minute / 60.0),
-                            'end': local_end.hour + (local_end.minute / 60.0)
-                        })
-                        
-                except Exception as err:
-                    print(f"Kunde inte läsa eventdata för {getattr(e, 'name', 'okänt')}: {err}")
-                    continue
-
-        week_view.append(day_struct)
+        })
     return week_view
 
 def get_icon_name(symbol_code, hour):
@@ -111,6 +141,7 @@ def get_icon_name(symbol_code, hour):
 
 def init_browser():
     global playwright_instance, browser_instance, page_instance
+    from playwright.sync_api import sync_playwright
     
     print("Startar browser...")
     start = time.time()
@@ -166,6 +197,81 @@ def take_screenshot_playwright(html_file_path, output_file_path):
         return False
 
 
+def render_html_in_memory(html_content):
+    """
+    Skickar html direkt till sidan och avkodar skärmdumpen i minnet.
+    Returnerar en PIL-bild eller None.
+    """
+    global page_instance
+
+    try:
+        start_time = time.time()
+        page_instance.set_content(html_content, wait_until='networkidle', timeout=10000)
+        png_bytes = page_instance.screenshot(type='png')
+        img = Image.open(io.BytesIO(png_bytes))
+        img.load()
+
+        elapsed = time.time() - start_time
+        print(f"screenshot (minne): {elapsed:.1f}s")
+
+        return img
+
+    except Exception as e:
+        print(f"Screenshot-fel: {e}")
+        return None
+
+
+def render_warm_page(template, context, reload=False):
+    """
+    Laddar dashboarden en gång och skickar sedan bara in de regioner
+    och kalenderdata som ändrats sedan förra bilden.
+    Returnerar en PIL-bild eller None.
+    """
+    global page_instance, warm_state
+
+    try:
+        start_time = time.time()
+        regions = {}
+        for block_name, element_id in WARM_PAGE_REGIONS.items():
+            block = template.blocks.get(block_name)
+            if block:
+                regions[element_id] = "".join(block(template.new_context(context)))
+        days = context.get('kalender_dagar') or []
+
+        if warm_state is None or reload:
+            page_instance.set_content(template.render(**context), wait_until='networkidle', timeout=10000)
+            if page_instance.evaluate("typeof window.updateDashboard === 'function'"):
+                warm_state = {"regions": regions, "days": days}
+            else:
+                print("Mallen saknar window.updateDashboard, laddar om hela sidan varje gång.")
+                warm_state = None
+            mode = "full laddning"
+        else:
+            changed = {k: v for k, v in regions.items() if warm_state["regions"].get(k) != v}
+            changed_days = days if days != warm_state["days"] else None
+            if changed or changed_days is not None:
+                page_instance.evaluate(
+                    "([regions, days]) => window.updateDashboard(regions, days)",
+                    [changed, changed_days]
+                )
+            warm_state = {"regions": regions, "days": days}
+            mode = f"patch {len(changed)} regioner" + (" + kalender" if changed_days is not None else "")
+
+        png_bytes = page_instance.screenshot(type='png')
+        img = Image.open(io.BytesIO(png_bytes))
+        img.load()
+
+        elapsed = time.time() - start_time
+        print(f"screenshot ({mode}): {elapsed:.1f}s")
+
+        return img
+
+    except Exception as e:
+        print(f"Screenshot-fel: {e}")
+        warm_state = None
+        return None
+
+
 def cleanup_browser():
     global playwright_instance, browser_instance, page_instance
     
@@ -182,158 +288,246 @@ def is_night_mode(current_hour):
 
     
 def main():
-    if epd_driver:
-        epd = epd_driver.EPD()
-        epd.init()
-        epd.Clear()
+    simulated = False
+    if epd_driver or EPD_PANEL:
+        epdconfig.configure_spi(EPD_SPI_SPEED_HZ, EPD_SPI_CHUNK_SIZE)
+        epd = panels.Panel(epd_driver or EPD_PANEL)
+    elif EPD_SIMULATE:
+        from waveshare_epd import epdsim
+        epdconfig.configure_spi(EPD_SPI_SPEED_HZ, EPD_SPI_CHUNK_SIZE)
+        epd = epdsim.SimulatedPanel(EPD_SIMULATE, realtime=True)
+        simulated = True
     else:
         epd = None
-
-    init_browser()
-
-    file_loader = FileSystemLoader('.')
-    env = Environment(loader=file_loader)
-    template = env.get_template('dashboard.html')
-    
-    cached_departures = []
-    cached_events = []
-    cached_weather = {'temp': '--', 'symbol': 'na'}
-    last_data_fetch = 0
-    last_calendar_fetch = 0
+    if epd:
+        print(f"Skärm: {epd}")
+        epd.init()
+        epd.clear()
+        epd.sleep()
+        if simulated:
+            print(epd.report())
+
+    print(f"Renderingsläge: {RENDER_BACKEND}")
+    template = None
+    if RENDER_BACKEND != "pillow":
+        init_browser()
+
+        file_loader = FileSystemLoader('.')
+        env = local_assets.register(Environment(loader=file_loader))
+        template_name = local_assets.template_path('dashboard.html')
+        print(f"Mall: {template_name}")
+        template = env.get_template(template_name)
     
-    try:
-        while True:
-            loop_start = time.time()
-            now = datetime.datetime.now()
-            
-            if is_night_mode(now.hour):
-                print(f"[{now.strftime('%H:%M')}] Nattläge - sover i {NIGHT_MODE_SLEEP}s...")
-                if epd:
-                    epd.clear()
-                time.sleep(NIGHT_MODE_SLEEP)
-                continue
+    differ = FrameDiffer()
+    cache = {
+        "events": [],
+        "weather": {'temp': '--', 'symbol': 'na'},
+        "spotify": None,
+        "frame": None,
+    }
+
+    departures = DepartureCache(parse_stops(STOP_AREA_GID, platform))
+
+    def store_departures(results):
+        departures.update(results)
+        for stop, _ in results:
+            print(f"Bussdata {stop.stop_name or stop.gid}: {len(stop.departures)} avgångar"
+                  f"{' (ändrad försening)' if stop.delay_changed else ''}")
+        print(f"Bussdata: nästa hämtning om {departures.poll_interval():.0f}s")
+
+    def awake():
+        # hämtningar och rendering för minuten som kommer räknas till den
+        return not is_night_mode((datetime.datetime.now() + datetime.timedelta(minutes=1)).hour)
+
+    def render(now=None):
+        # bilden ritas för den minut skärmen visar den, normalt nästa hela minut
+        now = now or datetime.datetime.fromtimestamp(display_job.due).replace(second=0, microsecond=0)
+        board = departures.board(now)
+        calendar_view = prepare_calendar_data(cache["events"], now)
+        
+        dagar_sv = ["Måndag", "Tisdag", "Onsdag", "Torsdag", "Fredag", "Lördag", "Söndag"]
+        manader_sv = ["Jan", "Feb", "Mar", "Apr", "Maj", "Jun", "Jul", "Aug", "Sep", "Okt", "Nov", "Dec"]
+        dag_namn = dagar_sv[now.weekday()]
+        manad_namn = f"{now.day} {manader_sv[now.month-1]}"
+        weather = cache["weather"]
+        sym_kod = weather.get('symbol', '1')
+        ikon_namn = get_icon_name(sym_kod, now.hour)
+        
+        context = dict(
+            hallplats_namn=departures.stop_name,
+            datum_dag=dag_namn,
+            datum_manad=manad_namn,
+            klockslag=now.strftime("%H:%M"),
+            vader_temp=weather.get('temp', '--'),
+            vader_symbol=weather.get('symbol', '1'),
+            vader_ikon=ikon_namn,
+            kalender_dagar=calendar_view,
+            avgangar=board,
+            spotify=cache["spotify"]
+        )
 
-            start = time.time()
-            print("Hämtar bussdata...")
-            try:
-                cached_departures, cached_stop_name = extract_board_data(
-                    stop_area_gid=STOP_AREA_GID, 
-                    filter_platforms=platform
-                )
-                print(f"Bussdata: {time.time()-start:.1f}s")
-            except Exception as e: 
-                print(f"Avgångsfel: {e}")
-
-            if time.time() - last_calendar_fetch > CALENDAR_FETCH_INTERVAL or last_calendar_fetch == 0:
-                start = time.time()
-                print("Hämtar kalender...")
-                try:
-                    cached_events = get_calendar_events(ICS_URL)
-                    print(f"Kalender: {time.time()-start:.1f}s")
-                except Exception as e: 
-                    print(f"Kalenderfel: {e}")
-                last_calendar_fetch = time.time()
-
-            if time.time() - last_data_fetch > DATA_FETCH_INTERVAL or last_data_fetch == 0:
-                start = time.time()
-                print("Hämtar väder...")
-                try:
-                    cached_weather = fetch_weather_data(lat=LATITUDE, lon=LONGITUDE)
-                    print(f"Väder: {time.time()-start:.1f}s")
-                except Exception as e: 
-                    print(f"Väderfel: {e}")
-                last_data_fetch = time.time()
+        img = None
 
+        if RENDER_BACKEND == "pillow":
             start = time.time()
-            calendar_view = prepare_calendar_data(cached_events)
-            
-            dagar_sv = ["Måndag", "Tisdag", "Onsdag", "Torsdag", "Fredag", "Lördag", "Söndag"]
-            manader_sv = ["Jan", "Feb", "Mar", "Apr", "Maj", "Jun", "Jul", "Aug", "Sep", "Okt", "Nov", "Dec"]
-            dag_namn = dagar_sv[now.weekday()]
-            manad_namn = f"{now.day} {manader_sv[now.month-1]}"
-            sym_kod = cached_weather.get('symbol', '1')
-            ikon_namn = get_icon_name(sym_kod, now.hour)
-            
-            start = time.time()
-            print("Hämtar Spotify...")
+            print("Renderar med Pillow...")
             try:
-                spotify_status = get_spotify_data()
-                print(f"Spotify: {time.time()-start:.1f}s")
+                img = render_dashboard(context)
+                print(f"pillow: {(time.time()-start)*1000:.0f}ms")
+                if not epd and not ZERO_DISK:
+                    img.save(IMAGE_FILENAME)
             except Exception as e:
-                print(f"Kunde inte hämta Spotify: {e}")
-                spotify_status = None
-                
+                print(f"Renderingsfel: {e}")
+        else:
             start = time.time()
             print(f"Renderar HTML...")
-            
-            html_content = template.render(
-                hallplats_namn=cached_stop_name,
-                datum_dag=dag_namn,
-                datum_manad=manad_namn,
-                klockslag=now.strftime("%H:%M"),
-                vader_temp=cached_weather.get('temp', '--'),
-                vader_symbol=cached_weather.get('symbol', '1'),
-                vader_ikon=ikon_namn,
-                kalender_dagar=calendar_view,
-                avgangar=cached_departures,
-                spotify=spotify_status
-            )
-
-            html_filename = "renderad_sida.html"
-            image_filename = "display_buffer.png"
-
-            with open(html_filename, "w", encoding='utf-8') as f:
-                f.write(html_content)
-            
-            success = take_screenshot_playwright(html_filename, image_filename)
-            
-            if success and os.path.exists(image_filename):
-                start = time.time()
-                img = Image.open(image_filename)
-                img_bw = img.convert("1")
-
-                if epd:
-                    buffer = epd.getbuffer(img_bw)
-                    
-                    if now.minute == 0 and now.second < 10:
+
+            if WARM_PAGE:
+                img = render_warm_page(template, context, reload=(now.minute == 0))
+            elif ZERO_DISK:
+                img = render_html_in_memory(template.render(**context))
+            else:
+                html_content = template.render(**context)
+                with open(HTML_FILENAME, "w", encoding='utf-8') as f:
+                    f.write(html_content)
+                
+                success = take_screenshot_playwright(HTML_FILENAME, IMAGE_FILENAME)
+                if success and os.path.exists(IMAGE_FILENAME):
+                    img = Image.open(IMAGE_FILENAME)
+
+        if img is None:
+            cache["frame"] = None
+            return
+        cache["frame"] = prepare_frame(now, img, board)
+
+    def prepare_frame(now, img, board):
+        """
+        Allt som kan göras före minutskiftet: bufferten, vilka pixlar som ändrats,
+        uppdateringssätt och att väcka skärmen. Kvar till display() är bara överföringen.
+        """
+        img_bw = img.convert("1")
+        frame = {"time": now, "image": img, "board": board}
+        if not epd:
+            frame["buffer"] = img_bw.tobytes()
+            return frame
+
+        start = time.time()
+        buffer = epd.getbuffer(img_bw)
+        changed = differ.changed_pixels(buffer)
+        full_refresh = now.minute == 0
+        frame.update(buffer=buffer, changed=changed, full_refresh=full_refresh, mode=None)
+        if changed == 0 and not full_refresh:
+            return frame
+
+        mode = epd.choose_mode(changed, len(buffer) * 8, full_refresh, FULL_REFRESH_CHANGED_RATIO)
+        regions = None
+        if mode == "partial" and epd.partial_regions:
+            regions = differ.changed_regions(buffer, epd.width, epd.height, MAX_PARTIAL_REGIONS)
+        try:
+            epd.init(mode)
+        except epdconfig.BusyTimeoutError as e:
+            print(f"Skärmen svarar inte: {e}")
+            differ.reset()
+            return None
+        frame.update(mode=mode, regions=regions)
+        print(f"förberedd bild {now.strftime('%H:%M')}: {time.time()-start:.2f}s")
+        return frame
+
+    def display():
+        now = datetime.datetime.now()
+        if is_night_mode(now.hour):
+            if epd and differ.last_buffer is not None:
+                print(f"[{now.strftime('%H:%M')}] Nattläge")
+                # skärmen töms en gång per natt, morgonens första bild blir en full uppdatering
+                epd.init()
+                epd.clear()
+                epd.sleep()
+                differ.reset()
+            return
+
+        minute = now.replace(second=0, microsecond=0)
+        if cache["frame"] is None or cache["frame"]["time"] != minute:
+            # ingen bild förberedd för den här minuten (t.ex. precis efter start), rita den nu
+            render(minute)
+        frame, cache["frame"] = cache["frame"], None
+        if frame is None:
+            print("Kunde inte generera bild, hoppar över skärmuppdatering.")
+            return
+
+        start = time.time()
+
+        if epd:
+            buffer, changed, mode = frame["buffer"], frame["changed"], frame["mode"]
+            if mode is None:
+                print("Ingen pixel ändrad, hoppar över skärmuppdatering.")
+            else:
+                try:
+                    if frame["full_refresh"]:
                         print("Full refresh med Clear...")
-                        epd.init()
-                        epd.Clear()
-                        epd.display(buffer)
+                        epd.clear()
                     else:
-                        print("Uppdaterar display...")
-                        epd.init_part()
-                        epd.display(buffer)
-
+                        regions = frame["regions"]
+                        print(f"{REFRESH_MODE_NAMES[mode]} uppdatering ({'första bilden' if changed is None else f'{changed} pixlar ändrade'})"
+                              f"{f': {regions}' if regions else '...'}")
+                    epd.display(buffer, frame["regions"])
                     epd.sleep()
+                    differ.update(buffer)
                     print(f"display: {time.time()-start:.1f}s")
-                else:
-                    print(f"Simulering klar: {len(cached_departures)} bussar hittades. Bild sparad som {image_filename}")
+                    if simulated:
+                        print(epd.report())
+                except epdconfig.BusyTimeoutError as e:
+                    # skärmen hänger, nästa bild skickas som full uppdatering
+                    print(f"Skärmen svarar inte: {e}")
+                    differ.reset()
+        else:
+            changed = differ.changed_pixels(frame["buffer"])
+            differ.update(frame["buffer"])
+            print(f"Ändrade pixlar: {'alla' if changed is None else changed}")
+            img = frame["image"]
+            if ZERO_DISK:
+                print(f"Simulering klar: {len(frame['board'])} bussar hittades. Bild {img.size[0]}x{img.size[1]} i minnet")
             else:
-                print("Kunde inte generera bild, hoppar över skärmuppdatering.")
-
-            total_time = time.time() - loop_start
-            print(f"total tid: {total_time:.1f}s\n")
-
-            now_after_update = datetime.datetime.now()
-            seconds_until_next_minute = 60 - now_after_update.second
-            
-            if seconds_until_next_minute < 1:
-                seconds_until_next_minute += 60
-            
-            print(f"Väntar {seconds_until_next_minute}s till nästa minut...")
-            time.sleep(seconds_until_next_minute)
+                print(f"Simulering klar: {len(frame['board'])} bussar hittades. Bild sparad som {IMAGE_FILENAME}")
+        print(f"[{now.strftime('%H:%M:%S.%f')[:-3]}] bild {frame['time'].strftime('%H:%M')} klar efter {time.time()-start:.1f}s\n")
+
+    # Hämtningarna går i bakgrunden när de står på tur. Nästa minuts bild ritas RENDER_LEAD s
+    # före minutskiftet och visas på det, bussar och Spotify hämtas så att svaret hinner komma innan dess.
+    # Avgångarnas minuter räknas om för varje bild, Västtrafik frågas bara när poll_interval säger till,
+    # och då bara om de hållplatser som står på tur, samtidigt.
+    display_job = Job("display", "Skärm", display, align=60, background=False)
+    scheduler = Scheduler([
+        Job("departures", "Bussdata", departures.fetch,
+            interval=departures.poll_interval, align=60, lead=RENDER_LEAD + FETCH_TIMEOUTS["departures"],
+            timeout=FETCH_TIMEOUTS["departures"], retry=15, when=awake, on_result=store_departures),
+        Job("spotify", "Spotify", get_spotify_data,
+            align=60, lead=RENDER_LEAD + FETCH_TIMEOUTS["spotify"], timeout=FETCH_TIMEOUTS["spotify"],
+            when=awake, on_result=lambda result: cache.update(spotify=result)),
+        Job("calendar", "Kalender", lambda: get_calendar_events(ICS_URL),
+            interval=CALENDAR_FETCH_INTERVAL, jitter=60, timeout=FETCH_TIMEOUTS["calendar"],
+            retry=60, when=awake, on_result=lambda result: cache.update(events=result)),
+        Job("weather", "Väder", lambda: fetch_weather_data(lat=LATITUDE, lon=LONGITUDE),
+            interval=DATA_FETCH_INTERVAL, jitter=30, timeout=FETCH_TIMEOUTS["weather"],
+            retry=30, when=awake, on_result=lambda result: cache.update(weather=result)),
+        Job("render", "Rendering", lambda: render(), align=60, lead=RENDER_LEAD, background=False, when=awake),
+        display_job,
+    ])
 
+    try:
+        scheduler.run()
     except KeyboardInterrupt:
         print("Avslutar...")
+        scheduler.shutdown()
+        close_session()
         cleanup_browser()
         if epd:
             epd.init()
-            epd.Clear()
+            epd.clear()
             epd.sleep()
     except Exception as e:
+        scheduler.shutdown()
+        close_session()
         cleanup_browser()
         traceback.print_exc()
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,433 @@
+import os
+import io
+from PIL import Image, ImageDraw, ImageFont
+from http_session import get_session
+
+# Ritar samma regioner som dashboard.html direkt med Pillow,
+# så att Chromium aldrig behöver startas.
+
+DISPLAY_WIDTH = 480
+DISPLAY_HEIGHT = 800
+FONT_DIR = os.environ.get("FONT_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "assets", "fonts"))
+
+BLACK = 0
+WHITE = 255
+GRAY_100 = 243
+GRAY_600 = 75
+
+FRAME = 6
+HEADER_HEIGHT = 200
+TOPBAR_HEIGHT = 40
+SCHEDULE_BAR_HEIGHT = 30
+CALENDAR_HEIGHT = 350
+CALENDAR_HEADER_HEIGHT = 25
+TRANSIT_BAR_HEIGHT = 35
+BUS_ROW_HEIGHT = 60
+MAX_BUS_ROWS = 3
+
+CALENDAR_START_HOUR = 6
+CALENDAR_TOTAL_HOURS = 18
+
+FONT_FILES = {
+    "display": ["ArchivoBlack-Regular.ttf", "DejaVuSans-Bold.ttf"],
+    "mono": ["SpaceMono-Regular.ttf", "DejaVuSansMono.ttf"],
+    "mono_bold": ["SpaceMono-Bold.ttf", "DejaVuSansMono-Bold.ttf"],
+}
+
+_font_cache = {}
+_album_art_cache = {}
+
+
+def get_font(kind, size):
+    key = (kind, size)
+    if key in _font_cache:
+        return _font_cache[key]
+
+    font = None
+    for filename in FONT_FILES[kind]:
+        for path in (os.path.join(FONT_DIR, filename), filename):
+            try:
+                font = ImageFont.truetype(path, size)
+                break
+            except OSError:
+                continue
+        if font:
+            break
+
+    if font is None:
+        print(f"Hittade inget typsnitt för '{kind}' i {FONT_DIR}, använder standard.")
+        font = ImageFont.load_default(size=size)
+
+    _font_cache[key] = font
+    return font
+
+
+def fit_text(draw, text, font, max_width):
+    """
+    Kortar ner texten med '…' tills den får plats, som CSS truncate.
+    """
+    text = str(text)
+    if draw.textlength(text, font=font) <= max_width:
+        return text
+    while text and draw.textlength(text + "…", font=font) > max_width:
+        text = text[:-1]
+    return text.rstrip() + "…"
+
+
+def wrap_text(draw, text, font, max_width, max_lines):
+    """
+    Radbryter texten på ord, som CSS line-clamp.
+    """
+    words = str(text).split()
+    lines = []
+    current = ""
+    for word in words:
+        candidate = f"{current} {word}".strip()
+        if draw.textlength(candidate, font=font) <= max_width or not current:
+            current = candidate
+        else:
+            lines.append(current)
+            current = word
+    if current:
+        lines.append(current)
+
+    if len(lines) > max_lines:
+        lines = lines[:max_lines]
+        lines[-1] = fit_text(draw, lines[-1] + "…", font, max_width)
+    return [fit_text(draw, line, font, max_width) for line in lines]
+
+
+def text_vcenter(draw, xy, text, font, fill, anchor="l"):
+    """
+    Ritar text vertikalt centrerad kring y, anchor är 'l' eller 'r'.
+    """
+    draw.text(xy, str(text), font=font, fill=fill, anchor=anchor + "m")
+
+
+def load_album_art(url, size):
+    if not url:
+        return None
+    if url in _album_art_cache:
+        return _album_art_cache[url]
+    try:
+        response = get_session().get(url, timeout=5)
+        response.raise_for_status()
+        art = Image.open(io.BytesIO(response.content)).convert("L")
+        art = art.resize((size, size))
+    except Exception as e:
+        print(f"Kunde inte hämta omslagsbild: {e}")
+        art = None
+    _album_art_cache.clear()
+    _album_art_cache[url] = art
+    return art
+
+
+def draw_weather_icon(draw, name, box, width=3):
+    """
+    Förenklade versioner av Lucide-ikonerna från get_icon_name.
+    """
+    x0, y0, x1, y1 = box
+    w = x1 - x0
+    h = y1 - y0
+
+    def sun(cx, cy, r, rays=True):
+        draw.ellipse((cx - r, cy - r, cx + r, cy + r), outline=BLACK, width=width)
+        if rays:
+            for dx, dy in ((0, -1), (0, 1), (-1, 0), (1, 0), (-0.7, -0.7), (0.7, 0.7), (-0.7, 0.7), (0.7, -0.7)):
+                draw.line((cx + dx * r * 1.5, cy + dy * r * 1.5, cx + dx * r * 2, cy + dy * r * 2), fill=BLACK, width=width)
+
+    def moon(cx, cy, r):
+        draw.ellipse((cx - r, cy - r, cx + r, cy + r), fill=BLACK)
+        draw.ellipse((cx - r * 0.4, cy - r * 1.3, cx + r * 1.6, cy + r * 0.7), fill=WHITE)
+
+    def cloud(left, top, right, bottom):
+        cw = right - left
+        ch = bottom - top
+        draw.ellipse((left, top + ch * 0.35, left + cw * 0.45, bottom), fill=WHITE, outline=BLACK, width=width)
+        draw.ellipse((left + cw * 0.2, top, left + cw * 0.8, top + ch * 0.8), fill=WHITE, outline=BLACK, width=width)
+        draw.ellipse((left + cw * 0.55, top + ch * 0.3, right, bottom), fill=WHITE, outline=BLACK, width=width)
+        draw.rectangle((left + cw * 0.22, top + ch * 0.6, left + cw * 0.78, bottom - width), fill=WHITE)
+        draw.line((left + cw * 0.22, bottom - width // 2, left + cw * 0.78, bottom - width // 2), fill=BLACK, width=width)
+
+    if name == "sun":
+        sun(x0 + w / 2, y0 + h / 2, w * 0.2)
+        return
+    if name == "moon":
+        moon(x0 + w / 2, y0 + h / 2, w * 0.38)
+        return
+    if name == "cloud-sun":
+        sun(x0 + w * 0.32, y0 + h * 0.3, w * 0.14)
+    elif name == "cloud-moon":
+        moon(x0 + w * 0.3, y0 + h * 0.3, w * 0.2)
+    elif name == "snowflake":
+        cx, cy, r = x0 + w / 2, y0 + h / 2, w * 0.45
+        for dx, dy in ((0, 1), (0.87, 0.5), (0.87, -0.5)):
+            draw.line((cx - dx * r, cy - dy * r, cx + dx * r, cy + dy * r), fill=BLACK, width=width)
+        return
+
+    has_precip = name in ("cloud-drizzle", "cloud-rain", "cloud-lightning", "cloud-hail", "cloud-fog")
+    cloud_bottom = y0 + h * (0.65 if has_precip else 0.85)
+    cloud(x0 + w * 0.05, y0 + h * 0.15, x1 - w * 0.05, cloud_bottom)
+
+    below = cloud_bottom + h * 0.08
+    if name == "cloud-drizzle":
+        for fx in (0.3, 0.5, 0.7):
+            draw.line((x0 + w * fx, below, x0 + w * fx, below + h * 0.08), fill=BLACK, width=width)
+            draw.line((x0 + w * fx, below + h * 0.16, x0 + w * fx, below + h * 0.22), fill=BLACK, width=width)
+    elif name == "cloud-rain":
+        for fx in (0.3, 0.5, 0.7):
+            draw.line((x0 + w * fx, below, x0 + w * (fx - 0.06), y1), fill=BLACK, width=width)
+    elif name == "cloud-lightning":
+        draw.line((x0 + w * 0.55, below, x0 + w * 0.42, below + h * 0.14, x0 + w * 0.58, below + h * 0.14, x0 + w * 0.45, y1),
+                  fill=BLACK, width=width, joint="curve")
+    elif name == "cloud-hail":
+        for fx in (0.3, 0.5, 0.7):
+            r = width
+            draw.ellipse((x0 + w * fx - r, below + h * 0.1 - r, x0 + w * fx + r, below + h * 0.1 + r), fill=BLACK)
+    elif name == "cloud-fog":
+        for i in range(2):
+            yy = below + i * h * 0.12
+            draw.line((x0 + w * 0.2, yy, x1 - w * 0.2, yy), fill=BLACK, width=width)
+
+
+def draw_header(draw, image, ctx):
+    left = FRAME
+    right = DISPLAY_WIDTH - FRAME
+    top = FRAME
+
+    # datumraden
+    sys_font = get_font("mono_bold", 12)
+    sys_text = "SYS.RDY // 2025"
+    sys_width = draw.textlength(sys_text, font=sys_font) + 16 + 3
+    draw.rectangle((left, top, right - sys_width, top + TOPBAR_HEIGHT - 3), fill=BLACK)
+    date_text = f"{ctx['datum_dag']} {ctx['datum_manad']}".upper()
+    text_vcenter(draw, (left + 8, top + TOPBAR_HEIGHT / 2 - 1), date_text, get_font("mono_bold", 14), WHITE)
+    draw.rectangle((right - sys_width, top, right - sys_width + 2, top + TOPBAR_HEIGHT - 3), fill=BLACK)
+    text_vcenter(draw, (right - 8, top + TOPBAR_HEIGHT / 2 - 1), sys_text, sys_font, BLACK, anchor="r")
+    draw.rectangle((left, top + TOPBAR_HEIGHT - 3, right, top + TOPBAR_HEIGHT - 1), fill=BLACK)
+
+    body_top = top + TOPBAR_HEIGHT
+    body_bottom = top + HEADER_HEIGHT
+    mid = (body_top + body_bottom) / 2
+    spotify = ctx.get('spotify')
+
+    if spotify and spotify.get('is_playing'):
+        clock_font = get_font("display", 72)
+        draw.text((left + 12, mid - 12), ctx['klockslag'], font=clock_font, fill=BLACK, anchor="ls")
+        temp_font = get_font("display", 30)
+        temp_text = f"{ctx['vader_temp']}°"
+        draw.text((left + 12, mid + 34), temp_text, font=temp_font, fill=BLACK, anchor="lm")
+        icon_x = left + 12 + draw.textlength(temp_text, font=temp_font) + 8
+        draw_weather_icon(draw, ctx['vader_ikon'], (icon_x, mid + 18, icon_x + 32, mid + 50))
+
+        art_size = 96
+        art_right = right - 12
+        art_left = art_right - art_size
+        art = load_album_art(spotify.get('image'), art_size)
+        if art:
+            image.paste(art, (int(art_left), int(mid - art_size / 2)))
+        draw.rectangle((art_left, mid - art_size / 2, art_right, mid + art_size / 2), outline=BLACK, width=3)
+
+        text_right = art_left - 12
+        text_width = text_right - (left + 12 + draw.textlength(ctx['klockslag'], font=clock_font) + 8)
+        track_font = get_font("mono_bold", 20)
+        lines = wrap_text(draw, str(spotify.get('track', '')).upper(), track_font, text_width, 3)
+        y = mid - 12 * len(lines) - 8
+        for line in lines:
+            draw.text((text_right, y), line, font=track_font, fill=BLACK, anchor="ra")
+            y += 21
+        artist_font = get_font("mono_bold", 14)
+        draw.text((text_right, y + 4), fit_text(draw, spotify.get('artist', ''), artist_font, text_width),
+                  font=artist_font, fill=BLACK, anchor="ra")
+        album_font = get_font("mono", 12)
+        draw.text((text_right, y + 24), fit_text(draw, spotify.get('album', ''), album_font, text_width),
+                  font=album_font, fill=GRAY_600, anchor="ra")
+    else:
+        temp_font = get_font("display", 48)
+        temp_text = f"{ctx['vader_temp']}°"
+        icon_size = 40
+        icon_left = right - 12 - icon_size
+        draw_weather_icon(draw, ctx['vader_ikon'], (icon_left, mid - 34, icon_left + icon_size, mid + 6))
+        draw.text((icon_left - 12, mid - 14), temp_text, font=temp_font, fill=BLACK, anchor="rm")
+
+        block_left = icon_left - 12 - draw.textlength(temp_text, font=temp_font)
+        draw.rectangle((block_left, mid + 16, right - 12, mid + 17), fill=BLACK)
+        draw.text((right - 12, mid + 22), "GBG_SE", font=get_font("mono_bold", 14), fill=BLACK, anchor="ra")
+
+        # krymp klockan om typsnittet är bredare än Archivo Black
+        size = 104
+        clock_font = get_font("display", size)
+        while size > 48 and draw.textlength(ctx['klockslag'], font=clock_font) > block_left - left - 24:
+            size -= 4
+            clock_font = get_font("display", size)
+        draw.text((left + 8, mid), ctx['klockslag'], font=clock_font, fill=BLACK, anchor="lm")
+
+
+def draw_calendar(draw, ctx, top):
+    left = FRAME
+    right = DISPLAY_WIDTH - FRAME
+    width = right - left
+
+    draw.rectangle((left, top, right, top + SCHEDULE_BAR_HEIGHT), fill=GRAY_100)
+    draw.rectangle((left, top, right, top + 2), fill=BLACK)
+    draw.rectangle((left, top + SCHEDULE_BAR_HEIGHT - 3, right, top + SCHEDULE_BAR_HEIGHT - 1), fill=BLACK)
+    text_vcenter(draw, (left + 8, top + SCHEDULE_BAR_HEIGHT / 2), "/// WEEK_SCHEDULE_V1.0", get_font("mono_bold", 12), BLACK)
+
+    section_top = top + SCHEDULE_BAR_HEIGHT
+    header_bottom = section_top + CALENDAR_HEADER_HEIGHT
+    body_top = header_bottom
+    body_bottom = section_top + CALENDAR_HEIGHT
+    body_height = CALENDAR_HEIGHT - CALENDAR_HEADER_HEIGHT
+
+    # rutnät bakom kolumnerna
+    label_font = get_font("mono", 9)
+    labels = ["06:00", "09:00", "12:00", "15:00", "18:00", "21:00"]
+    step = (body_height - 8 - 12) / (len(labels) - 1)
+    for i, label in enumerate(labels):
+        y = body_top + 4 + i * step
+        for x in range(left + 4, right, 6):
+            draw.point([(x, y), (x + 1, y), (x + 2, y)], fill=160)
+        draw.text((left + 4, y + 2), label, font=label_font, fill=140)
+
+    days = ctx.get('kalender_dagar') or []
+    if not days:
+        return
+
+    has_today = any(d.get('is_today') for d in days)
+    today_width = width * 5 / 12 if has_today else 0
+    other_width = (width - today_width) / max(1, len(days) - (1 if has_today else 0))
+
+    head_font = get_font("mono_bold", 12)
+    event_font = get_font("mono_bold", 10)
+    x = left
+    for day in days:
+        is_today = day.get('is_today')
+        col_width = today_width if is_today else other_width
+        x_end = x + col_width
+
+        if is_today:
+            draw.rectangle((x, section_top, x_end, header_bottom), fill=BLACK)
+        draw.text(((x + x_end) / 2, (section_top + header_bottom) / 2), str(day.get('namn', '')).upper(),
+                  font=head_font, fill=WHITE if is_today else BLACK, anchor="mm")
+
+        for evt in day.get('events') or []:
+            start = evt.get('start') or 8
+            end = evt.get('end') or 9
+            top_pct = 0 if start < CALENDAR_START_HOUR else min(100, (start - CALENDAR_START_HOUR) / CALENDAR_TOTAL_HOURS * 100)
+            height_pct = max(5, (end - start) / CALENDAR_TOTAL_HOURS * 100)
+            y0 = body_top + body_height * top_pct / 100
+            y1 = min(body_bottom, y0 + body_height * height_pct / 100)
+
+            if is_today:
+                ex0, ex1 = x + 4, x_end - 6
+                draw.rectangle((ex0 + 4, y0 + 4, ex1 + 4, y1 + 4), fill=BLACK)
+                draw.rectangle((ex0, y0, ex1, y1), fill=WHITE, outline=BLACK, width=3)
+                name = fit_text(draw, str(evt.get('name', '')).upper(), event_font, ex1 - ex0 - 10)
+                draw.text((ex0 + 5, (y0 + y1) / 2), name, font=event_font, fill=BLACK, anchor="lm")
+            else:
+                draw.rectangle((x + 2, y0, x_end - 4, y1), fill=BLACK)
+
+        draw.rectangle((x_end - 2, section_top, x_end - 1, body_bottom), fill=BLACK)
+        x = x_end
+
+    draw.rectangle((left, header_bottom - 3, right, header_bottom - 1), fill=BLACK)
+
+
+def draw_departures(draw, ctx, top):
+    left = FRAME
+    right = DISPLAY_WIDTH - FRAME
+
+    draw.rectangle((left, top, right, top + TRANSIT_BAR_HEIGHT), fill=BLACK)
+    mid = top + TRANSIT_BAR_HEIGHT / 2
+    bar_font = get_font("mono", 12)
+    later_x = right - 8
+    next_x = later_x - 80
+    stop_name = ctx.get('hallplats_namn') or 'TRANSIT'
+    stop_font = get_font("mono_bold", 14)
+    stop_text = fit_text(draw, f">> {stop_name}".upper(), stop_font, next_x - 96 - left - 8)
+    text_vcenter(draw, (left + 8, mid), stop_text, stop_font, WHITE)
+    text_vcenter(draw, (next_x, mid), "NEXT_DEP", bar_font, WHITE, anchor="r")
+    text_vcenter(draw, (later_x, mid), "LATER", bar_font, WHITE, anchor="r")
+
+    y = top + TRANSIT_BAR_HEIGHT
+    departures = ctx.get('avgangar') or []
+    if not departures:
+        box = (left + 16, y + 40 + 16, right - 16, y + 40 + 76)
+        for x in range(box[0], box[2], 8):
+            draw.line((x, box[1], x + 4, box[1]), fill=BLACK, width=2)
+            draw.line((x, box[3], x + 4, box[3]), fill=BLACK, width=2)
+        for yy in range(box[1], box[3], 8):
+            draw.line((box[0], yy, box[0], yy + 4), fill=BLACK, width=2)
+            draw.line((box[2], yy, box[2], yy + 4), fill=BLACK, width=2)
+        draw.text(((box[0] + box[2]) / 2, (box[1] + box[3]) / 2), "// NO_DATA_AVAILABLE //",
+                  font=get_font("mono", 14), fill=BLACK, anchor="mm")
+        return
+
+    line_font = get_font("display", 20)
+    dest_font = get_font("mono_bold", 18)
+    next_font = get_font("display", 24)
+    later_font = get_font("mono_bold", 14)
+    later_left = right - 80
+
+    for bus in departures[:MAX_BUS_ROWS]:
+        row_mid = y + BUS_ROW_HEIGHT / 2
+        badge_left = left + 8 + 4
+        draw.rectangle((badge_left, row_mid - 20, badge_left + 40, row_mid + 20), fill=BLACK)
+        draw.text((badge_left + 20, row_mid), str(bus['line']), font=line_font, fill=WHITE, anchor="mm")
+
+        dest_left = badge_left + 40 + 4 + 12
+        dest = fit_text(draw, str(bus['destination']).upper(), dest_font, later_left - 96 - dest_left - 8)
+        text_vcenter(draw, (dest_left, row_mid), dest, dest_font, BLACK)
+        text_vcenter(draw, (later_left - 8, row_mid), bus['next'], next_font, BLACK, anchor="r")
+
+        draw.rectangle((later_left, y, later_left + 1, y + BUS_ROW_HEIGHT - 2), fill=BLACK)
+        text_vcenter(draw, (right - 8, row_mid), bus['later'], later_font, GRAY_600, anchor="r")
+
+        draw.rectangle((left, y + BUS_ROW_HEIGHT - 2, right, y + BUS_ROW_HEIGHT - 1), fill=BLACK)
+        y += BUS_ROW_HEIGHT
+
+
+def render_dashboard(ctx):
+    """
+    Tar samma kontext som dashboard.html och returnerar en PIL-bild (L) på 480x800.
+    """
+    image = Image.new("L", (DISPLAY_WIDTH, DISPLAY_HEIGHT), WHITE)
+    draw = ImageDraw.Draw(image)
+
+    draw_header(draw, image, ctx)
+    calendar_top = FRAME + HEADER_HEIGHT
+    draw_calendar(draw, ctx, calendar_top)
+    draw_departures(draw, ctx, calendar_top + SCHEDULE_BAR_HEIGHT + CALENDAR_HEIGHT)
+
+    draw.rectangle((0, 0, DISPLAY_WIDTH - 1, DISPLAY_HEIGHT - 1), outline=BLACK, width=FRAME)
+    return image
+
+
+if __name__ == "__main__":
+    import time
+    import datetime
+
+    now = datetime.datetime.now()
+    example = {
+        "hallplats_namn": "Järntorget",
+        "datum_dag": "Måndag",
+        "datum_manad": f"{now.day} Okt",
+        "klockslag": now.strftime("%H:%M"),
+        "vader_temp": 12,
+        "vader_symbol": 3,
+        "vader_ikon": "cloud-sun",
+        "kalender_dagar": [
+            {"namn": n, "is_today": i == now.weekday(),
+             "events": [{"name": "Möte", "start": 9 + i, "end": 10.5 + i}]}
+            for i, n in enumerate(['M', 'T', 'O', 'T', 'F', 'L', 'S'])
+        ],
+        "avgangar": [
+            {"line": "6", "destination": "Kortedala", "next": "Nu", "later": "7"},
+            {"line": "11", "destination": "Saltholmen", "next": "4", "later": "14:25"},
+        ],
+        "spotify": None,
+    }
+    start = time.time()
+    img = render_dashboard(example)
+    print(f"render: {(time.time()-start)*1000:.0f}ms")
+    img.save("display_buffer.png")
@@ -0,0 +1,207 @@
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+# sekunder mellan kontrollerna av ett jobb som when hoppat över (jobb utan align)
+WHEN_RECHECK = 60
+
+
+class Job:
+    """
+    En återkommande uppgift i Scheduler.
+
+    interval: sekunder mellan körningarna, räknat från förra starten. Kan vara en funktion, som
+        då frågas igen när resultatet kommit (t.ex. tätare hämtningar när något är på väg att hända).
+    align: körs istället på jämna align sekunder (60 = varje hel minut), lead sekunder före gränsen,
+        och då på den första gränsen minst interval bort.
+    jitter: upp till så många sekunder slumpas på, så att källorna inte går i takt.
+    timeout: deadline för en körning i bakgrunden. Efter den räknas körningen som misslyckad,
+        men ett sent resultat används ändå när det kommer.
+    retry / max_backoff: efter ett fel körs jobbet om efter retry s, dubbelt så länge för varje
+        fel i rad, högst max_backoff s. retry=None: nästa ordinarie tid.
+    background: körs i trådpoolen (hämtningar), annars i huvudtråden (rendering, skärm).
+    when: körningen hoppas över när den returnerar False (t.ex. på natten), och when frågas
+        igen vid nästa gräns (hel minut utan align), så jobbet körs direkt när den säger ja.
+    on_result: får resultatet, anropas alltid i huvudtråden.
+    """
+
+    def __init__(self, name, label, func, interval=60, align=None, lead=0, jitter=0, timeout=None,
+                 retry=None, max_backoff=600, background=True, when=None, on_result=None):
+        self.name = name
+        self.label = label
+        self.func = func
+        self.interval = interval
+        self.align = align
+        self.lead = lead
+        self.jitter = jitter
+        self.timeout = timeout
+        self.retry = retry
+        self.max_backoff = max_backoff
+        self.background = background
+        self.when = when
+        self.on_result = on_result
+
+        self.due = 0
+        self.failures = 0
+        self.future = None
+        self.started = None
+        self.late = False
+
+    def next_due(self, now):
+        interval = self.interval() if callable(self.interval) else self.interval
+        if self.align:
+            # nästa gräns, men inte en som ligger så nära att en sen eller första körning
+            # upprepas direkt
+            now += max(0, interval - self.align)
+            due = (now + self.lead + self.align / 4) // self.align * self.align + self.align - self.lead
+        else:
+            due = now + interval
+        return due + random.uniform(0, self.jitter)
+
+    def recheck_due(self, now):
+        align = self.align or WHEN_RECHECK
+        return (now + self.lead + align / 4) // align * align + align - self.lead
+
+    def succeeded(self):
+        self.failures = 0
+
+    def failed(self, now):
+        self.failures += 1
+        if self.retry is not None:
+            self.due = now + min(self.max_backoff, self.retry * 2 ** (self.failures - 1))
+
+
+class Scheduler:
+    """
+    Kör jobben när de står på tur. Hämtningar går i en trådpool och huvudtråden väntar
+    på det som kommer först av ett färdigt resultat och nästa jobb, så inget görs i onödan
+    och justerade jobb hamnar på sin tid oavsett hur lång tid de andra tar.
+    Ett jobb i huvudtråden som står på tur samtidigt som hämtningar väntar in dem (högst
+    till deras deadline), så första bilden ritas med färsk data.
+    """
+
+    def __init__(self, jobs, max_workers=4):
+        self.jobs = list(jobs)
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="fetch")
+        now = time.time()
+        for job in self.jobs:
+            job.due = now
+
+    def run(self):
+        while True:
+            self.run_pending()
+            self.wait_for_next()
+
+    def run_pending(self):
+        now = time.time()
+        started = []
+        for job in sorted((j for j in self.jobs if j.due <= now), key=lambda j: j.due):
+            if job.when is not None and not job.when():
+                job.due = job.recheck_due(now)
+            elif job.background:
+                if self._start(job, now):
+                    started.append(job)
+            else:
+                if started:
+                    self._wait(started)
+                    started = []
+                self._run_inline(job)
+
+    def wait_for_next(self):
+        """Sover tills nästa jobb står på tur, men tar hand om färdiga hämtningar under tiden."""
+        while True:
+            now = time.time()
+            until = min(job.due for job in self.jobs)
+            running = [job for job in self.jobs if job.future is not None]
+            for job in running:
+                if not job.late and job.timeout is not None:
+                    until = min(until, job.started + job.timeout)
+            if until <= now:
+                self._check_deadlines(now)
+                if min(job.due for job in self.jobs) <= now:
+                    return
+                continue
+            if running:
+                wait([job.future for job in running], timeout=until - now, return_when=FIRST_COMPLETED)
+                self._collect()
+            else:
+                time.sleep(until - now)
+
+    def _start(self, job, now):
+        if job.future is not None:
+            print(f"{job.label}: pågår fortfarande ({now - job.started:.1f}s), hoppar över")
+            job.due = job.next_due(now)
+            return False
+        print(f"Hämtar {job.label.lower()}...")
+        job.started = now
+        job.late = False
+        job.future = self.executor.submit(job.func)
+        job.due = job.next_due(now)
+        return True
+
+    def _run_inline(self, job):
+        now = time.time()
+        job.due = job.next_due(now)
+        try:
+            result = job.func()
+            if job.on_result:
+                job.on_result(result)
+        except Exception as e:
+            print(f"{job.label}fel: {e}")
+            job.failed(time.time())
+            return
+        job.succeeded()
+
+    def _wait(self, jobs):
+        """Väntar tills jobben är klara eller deras deadline gått."""
+        while True:
+            now = time.time()
+            self._check_deadlines(now)
+            running = [job for job in jobs if job.future is not None and not job.late]
+            if not running:
+                return
+            deadlines = [job.started + job.timeout for job in running if job.timeout is not None]
+            timeout = max(0, min(deadlines) - now) if deadlines else None
+            wait([job.future for job in running], timeout=timeout, return_when=FIRST_COMPLETED)
+            self._collect()
+
+    def _collect(self):
+        for job in self.jobs:
+            if job.future is None or not job.future.done():
+                continue
+            future, late = job.future, job.late
+            job.future = None
+            try:
+                result = future.result()
+            except Exception as e:
+                print(f"{job.label}fel: {e}")
+                if not late:
+                    job.failed(time.time())
+                continue
+            if late:
+                print(f"{job.label}: sent resultat efter {time.time() - job.started:.1f}s")
+            else:
+                print(f"{job.label}: {time.time() - job.started:.1f}s")
+            try:
+                if job.on_result:
+                    job.on_result(result)
+            except Exception as e:
+                # ett resultat som inte går att använda räknas som ett fel, slingan fortsätter
+                print(f"{job.label}fel: {e}")
+                if not late:
+                    job.failed(time.time())
+                continue
+            job.succeeded()
+            if callable(job.interval):
+                job.due = job.next_due(job.started)
+
+    def _check_deadlines(self, now):
+        self._collect()
+        for job in self.jobs:
+            if job.future is not None and not job.late and job.timeout is not None and now >= job.started + job.timeout:
+                print(f"{job.label}: timeout efter {job.timeout}s")
+                job.late = True
+                job.failed(now)
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
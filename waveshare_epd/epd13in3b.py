@@ -30,6 +30,7 @@
 
 import logging
 from . import epdconfig
+from . import epdbuffer
 
 # Display resolution
 EPD_WIDTH       = 960
@@ -69,23 +70,14 @@ class EPD:
         epdconfig.digital_write(self.cs_pin, 1)
 
     def send_data(self, data):
-        epdconfig.digital_write(self.dc_pin, 1)
-        epdconfig.digital_write(self.cs_pin, 0)
-        epdconfig.spi_writebyte([data])
-        epdconfig.digital_write(self.cs_pin, 1)
+        epdconfig.spi_writedata(data)
 
     def send_data2(self, data):
-        epdconfig.digital_write(self.dc_pin, 1)
-        epdconfig.digital_write(self.cs_pin, 0)
-        epdconfig.SPI.writebytes2(data)
-        epdconfig.digital_write(self.cs_pin, 1)
+        epdconfig.spi_writedata(data)
 
     def ReadBusy(self):
         logger.debug("e-Paper busy")
-        busy = epdconfig.digital_read(self.busy_pin)
-        while(busy == 1):
-            busy = epdconfig.digital_read(self.busy_pin)
-            epdconfig.delay_ms(20)
+        epdconfig.wait_busy(1)
         epdconfig.delay_ms(20)
         logger.debug("e-Paper busy release")
 
@@ -156,28 +148,7 @@ class EPD:
 
 
     def getbuffer(self, image):
-        # logger.debug("bufsiz = ",int(self.width/8) * self.height)
-        buf = [0xFF] * (int(self.width / 8) * self.height)
-        image_monocolor = image.convert('1')
-        imwidth, imheight = image_monocolor.size
-        pixels = image_monocolor.load()
-        # logger.debug("imwidth = %d, imheight = %d",imwidth,imheight)
-        if imwidth == self.width and imheight == self.height:
-            logger.debug("Horizontal")
-            for y in range(imheight):
-                for x in range(imwidth):
-                    # Set the bits for the column of pixels at the current position.
-                    if pixels[x, y] == 0:
-                        buf[int((x + y * self.width) / 8)] &= ~(0x80 >> (x % 8))
-        elif imwidth == self.height and imheight == self.width:
-            logger.debug("Vertical")
-            for y in range(imheight):
-                for x in range(imwidth):
-                    newx = y
-                    newy = self.height - x - 1
-                    if pixels[x, y] == 0:
-                        buf[int((newx + newy * self.width) / 8)] &= ~(0x80 >> (y % 8))
-        return buf
+        return epdbuffer.getbuffer(image, self.width, self.height)
 
     def Clear(self):
         self.send_command(0x24)
@@ -198,36 +169,22 @@ class EPD:
         self.send_data2([0xFF] * (int(self.width/8) * self.height))
     
     def display(self, blackimage, ryimage):
-        if(self.width % 8 == 0):
-            Width = self.width // 8
-        else:
-            Width = self.width // 8 +1
-        Height = self.height
         if (blackimage != None):
             self.send_command(0x24)
             self.send_data2(blackimage)        
         if (ryimage != None):
-            for j in range(Height):
-                for i in range(Width):
-                    ryimage[i + j * Width] = ~ryimage[i + j * Width]
+            ryimage = epdbuffer.invert(ryimage)
             self.send_command(0x26)
             self.send_data2(ryimage)
 
         self.TurnOnDisplay()
 
     def display_Base(self, blackimage, ryimage):
-        if(self.width % 8 == 0):
-            Width = self.width // 8
-        else:
-            Width = self.width // 8 +1
-        Height = self.height
         if (blackimage != None):
             self.send_command(0x24)
             self.send_data2(blackimage)        
         if (ryimage != None):
-            for j in range(Height):
-                for i in range(Width):
-                    ryimage[i + j * Width] = ~ryimage[i + j * Width]
+            ryimage = epdbuffer.invert(ryimage)
             self.send_command(0x26)
             self.send_data2(ryimage)
 
@@ -278,17 +235,13 @@ class EPD:
         self.send_data((Ystart>>8) & 0x01)
 
         self.send_command(0x24) 
-        for j in range(Height):
-            for i in range(Width):
-                if((j > Ystart-1) & (j < (Yend + 1)) & (i > Xstart-1) & (i < (Xend + 1))):
-                    self.send_data(Image[i + j * Width])
+        for j in range(max(Ystart, 0), min(Yend + 1, Height)):
+            self.send_data2(Image[j * Width + max(Xstart, 0):j * Width + min(Xend + 1, Width)])
         self.TurnOnDisplay_Part()
 
         self.send_command(0x26) 
-        for j in range(Height):
-            for i in range(Width):
-                if((j > Ystart-1) & (j < (Yend + 1)) & (i > Xstart-1) & (i < (Xend + 1))):
-                    self.send_data(Image[i + j * Width])
+        for j in range(max(Ystart, 0), min(Yend + 1, Height)):
+            self.send_data2(Image[j * Width + max(Xstart, 0):j * Width + min(Xend + 1, Width)])
 
     def sleep(self):
         self.send_command(0x10) # DEEP_SLEEP
@@ -30,6 +30,7 @@
 
 import logging
 from . import epdconfig
+from . import epdbuffer
 
 # Display resolution
 EPD_WIDTH       = 80
@@ -105,20 +106,16 @@ class EPD:
         epdconfig.digital_write(self.cs_pin, 1)
 
     def send_data(self, data):
-        epdconfig.digital_write(self.dc_pin, 1)
-        epdconfig.digital_write(self.cs_pin, 0)
-        epdconfig.spi_writebyte([data])
-        epdconfig.digital_write(self.cs_pin, 1)
+        epdconfig.spi_writedata(data)
+
+    # send a lot of data
+    def send_data2(self, data):
+        epdconfig.spi_writedata(data)
         
     def ReadBusy(self):
         logger.debug("e-Paper busy")
         self.send_command(0x71)
-        busy = epdconfig.digital_read(self.busy_pin)
-        busy =not(busy & 0x01)
-        while(busy):
-            self.send_command(0x71)
-            busy = epdconfig.digital_read(self.busy_pin)
-            busy =not(busy & 0x01)
+        epdconfig.wait_busy(0)
         epdconfig.delay_ms(800)
         logger.debug("e-Paper busy release")        
 
@@ -129,21 +126,17 @@ class EPD:
 
     def SetFulltReg(self):
         self.send_command(0x23)
-        for count in range(0, 42):
-            self.send_data(self.lut_w1[count]) 
+        self.send_data2(self.lut_w1[0:42])
         
         self.send_command(0x24)
-        for count in range(0, 42):
-            self.send_data(self.lut_b1[count])     
+        self.send_data2(self.lut_b1[0:42])
 
     def SetPartReg(self):
         self.send_command(0x23)
-        for count in range(0, 42):
-            self.send_data(self.lut_w[count]) 
+        self.send_data2(self.lut_w[0:42])
         
         self.send_command(0x24)
-        for count in range(0, 42):
-            self.send_data(self.lut_b[count])     
+        self.send_data2(self.lut_b[0:42])
 
     def Init(self):
         if (epdconfig.module_init() != 0):
@@ -239,26 +232,7 @@ class EPD:
         return 0
     
     def getbuffer(self, image):
-        buf = [0xFF] * (int(self.width / 8) * self.height)
-        image_monocolor = image.convert('1')
-        imwidth, imheight = image_monocolor.size
-        pixels = image_monocolor.load()
-        if(imwidth == self.width and imheight == self.height):
-            logger.debug("Horizontal")
-            for y in range(imheight):
-                for x in range(imwidth):
-                    # Set the bits for the column of pixels at the current position.
-                    if pixels[x, y] == 0:
-                        buf[int((x + y * self.width) / 8)] &= ~(0x80 >> (x % 8))
-        elif(imwidth == self.height and imheight == self.width):
-            logger.debug("Vertical")
-            for y in range(imheight):
-                for x in range(imwidth):
-                    newx = y
-                    newy = self.height - x - 1
-                    if pixels[x, y] == 0:
-                        buf[int((newx + newy*self.width) / 8)] &= ~(0x80 >> (y % 8))
-        return buf
+        return epdbuffer.getbuffer(image, self.width, self.height)
 
     def display(self, image):
         if (image == None):
@@ -270,14 +244,10 @@ class EPD:
             Width = self.width // 8 + 1
             
         self.send_command(0x10)
-        for j in range(0, self.height):
-            for i in range(0, int(Width)):
-                self.send_data(0xff)  
+        self.send_data2([0xff] * self.height * int(Width))
         
         self.send_command(0x13)
-        for j in range(0, self.height):
-            for i in range(0, int(Width)):
-                self.send_data(image[i + j * int(Width)])  
+        self.send_data2(image[0:self.height * int(Width)])
         self.TurnOnDisplay()
         
     def Clear(self):
@@ -290,14 +260,10 @@ class EPD:
         Height = self.height
         
         self.send_command(0x10)
-        for j in range(0, Height):
-            for i in range(0, int(Width)):
-                self.send_data(0x00)  
+        self.send_data2([0x00] * Height * int(Width))
         
         self.send_command(0x13)
-        for j in range(0, Height):
-            for i in range(0, int(Width)):
-                self.send_data(0xff)  
+        self.send_data2([0xff] * Height * int(Width))
         self.TurnOnDisplay()
 
     def DisplayPartial(self, old_Image, Image):
@@ -321,14 +287,10 @@ class EPD:
         Height = self.height
         # send data
         self.send_command(0x10)
-        for j in range(0, Height):
-            for i in range(0, int(Width)):
-                self.send_data(old_Image[i + j * int(Width)])
+        self.send_data2(old_Image[0:Height * int(Width)])
 
         self.send_command(0x13)
-        for j in range(0, Height):
-            for i in range(0, int(Width)):
-                self.send_data(Image[i + j * int(Width)])
+        self.send_data2(Image[0:Height * int(Width)])
 
         # Set partial refresh
         self.TurnOnDisplay()
@@ -81,6 +81,7 @@
 
 import logging
 from . import epdconfig
+from . import epdbuffer
 
 # Display resolution
 EPD_WIDTH       = 200
@@ -127,15 +128,15 @@ class EPD:
         epdconfig.digital_write(self.cs_pin, 1)
 
     def send_data(self, data):
-        epdconfig.digital_write(self.dc_pin, 1)
-        epdconfig.digital_write(self.cs_pin, 0)
-        epdconfig.spi_writebyte([data])
-        epdconfig.digital_write(self.cs_pin, 1)
+        epdconfig.spi_writedata(data)
+
+    # send a lot of data
+    def send_data2(self, data):
+        epdconfig.spi_writedata(data)
         
     def ReadBusy(self):
         logger.debug("e-Paper busy")
-        while(epdconfig.digital_read(self.busy_pin) == 1):      # 0: idle, 1: busy
-            epdconfig.delay_ms(100)
+        epdconfig.wait_busy(1)      # 0: idle, 1: busy
         logger.debug("e-Paper busy release")
 
     def TurnOnDisplay(self):
@@ -197,32 +198,12 @@ class EPD:
         
         # set the look-up table register
         self.send_command(0x32)
-        for i in range(0, len(lut)):
-            self.send_data(lut[i])
+        self.send_data2(lut)
         # EPD hardware init end
         return 0
 
     def getbuffer(self, image):
-        buf = [0xFF] * (int(self.width / 8) * self.height)
-        image_monocolor = image.convert('1')
-        imwidth, imheight = image_monocolor.size
-        pixels = image_monocolor.load()
-        if(imwidth == self.width and imheight == self.height):
-            logger.debug("Horizontal")
-            for y in range(imheight):
-                for x in range(imwidth):
-                    # Set the bits for the column of pixels at the current position.
-                    if pixels[x, y] == 0:
-                        buf[int((x + y * self.width) / 8)] &= ~(0x80 >> (x % 8))
-        elif(imwidth == self.height and imheight == self.width):
-            logger.debug("Vertical")
-            for y in range(imheight):
-                for x in range(imwidth):
-                    newx = y
-                    newy = self.height - x - 1
-                    if pixels[x, y] == 0:
-                        buf[int((newx + newy*self.width) / 8)] &= ~(0x80 >> (y % 8))
-        return buf
+        return epdbuffer.getbuffer(image, self.width, self.height)
 
     def display(self, image):
         if (image == None):
@@ -232,8 +213,7 @@ class EPD:
         for j in range(0, self.height):
             self.SetCursor(0, j)
             self.send_command(0x24)
-            for i in range(0, int(self.width / 8)):
-                self.send_data(image[i + j * int(self.width / 8)])   
+            self.send_data2(image[j * int(self.width / 8):(j + 1) * int(self.width / 8)])
         self.TurnOnDisplay()
         
     def Clear(self, color=0xFF):
@@ -245,8 +225,7 @@ class EPD:
         for j in range(0, self.height):
             self.SetCursor(0, j)
             self.send_command(0x24)
-            for i in range(0, int(self.width / 8)):
-                self.send_data(color)
+            self.send_data2([color] * int(self.width / 8))
         # epdconfig.digital_write(self.cs_pin, 1)
         self.TurnOnDisplay()
 
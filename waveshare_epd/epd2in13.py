@@ -30,6 +30,7 @@
 
 import logging
 from . import epdconfig
+from . import epdbuffer
 
 # Display resolution
 EPD_WIDTH       = 122
@@ -76,14 +77,14 @@ class EPD:
         epdconfig.digital_write(self.cs_pin, 1)
 
     def send_data(self, data):
-        epdconfig.digital_write(self.dc_pin, 1)
-        epdconfig.digital_write(self.cs_pin, 0)
-        epdconfig.spi_writebyte([data])
-        epdconfig.digital_write(self.cs_pin, 1)
+        epdconfig.spi_writedata(data)
+
+    # send a lot of data
+    def send_data2(self, data):
+        epdconfig.spi_writedata(data)
         
     def ReadBusy(self):        
-        while(epdconfig.digital_read(self.busy_pin) == 1):      # 0: idle, 1: busy
-            epdconfig.delay_ms(100)            
+        epdconfig.wait_busy(1)      # 0: idle, 1: busy
 
     def TurnOnDisplay(self):
         self.send_command(0x22) # DISPLAY_UPDATE_CONTROL_2
@@ -127,8 +128,7 @@ class EPD:
         
         # WRITE_LUT_REGISTER
         self.send_command(0x32)
-        for count in range(30):
-            self.send_data(lut[count])
+        self.send_data2(lut[0:30])
 
         return 0
         
@@ -158,35 +158,8 @@ class EPD:
         self.ReadBusy()
         
     def getbuffer(self, image):
-        if self.width%8 == 0:
-            linewidth = int(self.width/8)
-        else:
-            linewidth = int(self.width/8) + 1
-         
-        buf = [0xFF] * (linewidth * self.height)
-        image_monocolor = image.convert('1')
-        imwidth, imheight = image_monocolor.size
-        pixels = image_monocolor.load()
-        
-        if(imwidth == self.width and imheight == self.height):
-            logger.debug("Vertical")
-            for y in range(imheight):
-                for x in range(imwidth):                    
-                    if pixels[x, y] == 0:
-                        # x = imwidth - x
-                        buf[int(x / 8) + y * linewidth] &= ~(0x80 >> (x % 8))
-        elif(imwidth == self.height and imheight == self.width):
-            logger.debug("Horizontal")
-            for y in range(imheight):
-                for x in range(imwidth):
-                    newx = y
-                    newy = self.height - x - 1
-                    if pixels[x, y] == 0:
-                        # newy = imwidth - newy - 1
-                        buf[int(newx / 8) + newy*linewidth] &= ~(0x80 >> (y % 8))
-        return buf   
+        return epdbuffer.getbuffer(image, self.width, self.height)
 
-        
     def display(self, image):
         if self.width%8 == 0:
             linewidth = int(self.width/8)
@@ -197,8 +170,7 @@ class EPD:
         for j in range(0, self.height):
             self.SetCursor(0, j);
             self.send_command(0x24);
-            for i in range(0, linewidth):
-                self.send_data(image[i + j * linewidth])   
+            self.send_data2(image[j * linewidth:(j + 1) * linewidth])
         self.TurnOnDisplay()
     
     def Clear(self, color=0xFF):
@@ -211,8 +183,7 @@ class EPD:
         for j in range(0, self.height):
             self.SetCursor(0, j);
             self.send_command(0x24);
-            for i in range(0, linewidth):
-                self.send_data(color)   
+            self.send_data2([color] * linewidth)
         self.TurnOnDisplay()
 
     def sleep(self):
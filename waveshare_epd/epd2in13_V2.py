@@ -30,6 +30,8 @@
 
 import logging
 from . import epdconfig
+from . import epdbuffer
+from PIL import Image
 
 # Display resolution
 EPD_WIDTH       = 122
@@ -100,21 +102,14 @@ class EPD:
         epdconfig.digital_write(self.cs_pin, 1)
 
     def send_data(self, data):
-        epdconfig.digital_write(self.dc_pin, 1)
-        epdconfig.digital_write(self.cs_pin, 0)
-        epdconfig.spi_writebyte([data])
-        epdconfig.digital_write(self.cs_pin, 1)
+        epdconfig.spi_writedata(data)
 
     # send a lot of data   
     def send_data2(self, data):
-        epdconfig.digital_write(self.dc_pin, 1)
-        epdconfig.digital_write(self.cs_pin, 0)
-        epdconfig.spi_writebyte2(data)
-        epdconfig.digital_write(self.cs_pin, 1)
+        epdconfig.spi_writedata(data)
         
     def ReadBusy(self):
-        while(epdconfig.digital_read(self.busy_pin) == 1):      # 0: idle, 1: busy
-            epdconfig.delay_ms(100)    
+        epdconfig.wait_busy(1)      # 0: idle, 1: busy
 
     def TurnOnDisplay(self):
         self.send_command(0x22)
@@ -181,8 +176,7 @@ class EPD:
             self.send_data(self.lut_full_update[75])
 
             self.send_command(0x32)
-            for count in range(70):
-                self.send_data(self.lut_full_update[count])
+            self.send_data2(self.lut_full_update[0:70])
 
             self.send_command(0x4E)   # set RAM x address count to 0
             self.send_data(0x00)
@@ -197,8 +191,7 @@ class EPD:
             self.ReadBusy()
 
             self.send_command(0x32)
-            for count in range(70):
-                self.send_data(self.lut_partial_update[count])
+            self.send_data2(self.lut_partial_update[0:70])
 
             self.send_command(0x37)
             self.send_data(0x00)
@@ -219,33 +212,20 @@ class EPD:
         return 0
 
     def getbuffer(self, image):
-        if self.width%8 == 0:
-            linewidth = int(self.width/8)
-        else:
-            linewidth = int(self.width/8) + 1
-         
-        buf = [0xFF] * (linewidth * self.height)
+        linewidth = epdbuffer.linewidth(self.width)
         image_monocolor = image.convert('1')
         imwidth, imheight = image_monocolor.size
-        pixels = image_monocolor.load()
-        
+        # white canvas with whole bytes per line, the panel's RAM is mirrored
+        canvas = Image.new('1', (linewidth * 8, self.height), 1)
+
         if(imwidth == self.width and imheight == self.height):
             logger.debug("Vertical")
-            for y in range(imheight):
-                for x in range(imwidth):                    
-                    if pixels[x, y] == 0:
-                        x = imwidth - x
-                        buf[int(x / 8) + y * linewidth] &= ~(0x80 >> (x % 8))
+            # pixel x ends up at bit (imwidth - x) of its line
+            canvas.paste(image_monocolor.transpose(Image.Transpose.FLIP_LEFT_RIGHT), (1, 0))
         elif(imwidth == self.height and imheight == self.width):
             logger.debug("Horizontal")
-            for y in range(imheight):
-                for x in range(imwidth):
-                    newx = y
-                    newy = self.height - x - 1
-                    if pixels[x, y] == 0:
-                        newy = imwidth - newy - 1
-                        buf[int(newx / 8) + newy*linewidth] &= ~(0x80 >> (y % 8))
-        return buf   
+            canvas.paste(image_monocolor.transpose(Image.Transpose.TRANSPOSE), (0, 0))
+        return epdbuffer.pack_1bit(canvas)
         
         
     def display(self, image):
@@ -254,15 +234,7 @@ class EPD:
         self.TurnOnDisplay()
         
     def displayPartial(self, image):
-        if self.width%8 == 0:
-            linewidth = int(self.width/8)
-        else:
-            linewidth = int(self.width/8) + 1
-
-        buf = [0x00] * self.height * linewidth
-        for j in range(0, self.height):
-            for i in range(0, linewidth):
-                buf[i + j * linewidth] = ~image[i + j * linewidth]
+        buf = epdbuffer.invert(image)
 
         self.send_command(0x24)
         self.send_data2(image)   
@@ -30,6 +30,7 @@
 
 import logging
 from . import epdconfig
+from . import epdbuffer
 
 import PIL
 from PIL import Image
@@ -39,6 +40,9 @@ import io
 EPD_WIDTH       = 122
 EPD_HEIGHT      = 250
 
+# black, white, yellow, red
+PALETTE = ((0, 0, 0), (255, 255, 255), (255, 255, 0), (255, 0, 0))
+
 logger = logging.getLogger(__name__)
 
 class EPD:
@@ -76,16 +80,16 @@ class EPD:
         epdconfig.digital_write(self.cs_pin, 1)
 
     def send_data(self, data):
-        epdconfig.digital_write(self.dc_pin, 1)
-        epdconfig.digital_write(self.cs_pin, 0)
-        epdconfig.spi_writebyte([data])
-        epdconfig.digital_write(self.cs_pin, 1)
+        epdconfig.spi_writedata(data)
+
+    # send a lot of data
+    def send_data2(self, data):
+        epdconfig.spi_writedata(data)
         
     def ReadBusy(self):
         logger.debug("e-Paper busy H")
         epdconfig.delay_ms(100)
-        while(epdconfig.digital_read(self.busy_pin) == 0):      # 0: idle, 1: busy
-            epdconfig.delay_ms(5)
+        epdconfig.wait_busy(0)      # 0: idle, 1: busy
         logger.debug("e-Paper busy release")
         
     def SetWindow(self):
@@ -165,40 +169,7 @@ class EPD:
         return 0
 
     def getbuffer(self, image):
-        # Create a pallette with the 4 colors supported by the panel
-        pal_image = Image.new("P", (1,1))
-        pal_image.putpalette( (0,0,0,  255,255,255,  255,255,0,   255,0,0) + (0,0,0)*252)
-
-        # Check if we need to rotate the image
-        imwidth, imheight = image.size
-        if(imwidth == self.width and imheight == self.height):
-            image_temp = image
-        elif(imwidth == self.height and imheight == self.width):
-            image_temp = image.rotate(90, expand=True)
-        else:
-            logger.warning("Invalid image dimensions: %d x %d, expected %d x %d" % (imwidth, imheight, self.width, self.height))
-
-        # Convert the soruce image to the 4 colors, dithering if needed
-        image_4color = image_temp.convert("RGB").quantize(palette=pal_image)
-        buf_4color = bytearray(image_4color.tobytes('raw'))
-
-        # into a single byte to transfer to the panel
-        if self.width % 4 == 0 :
-            Width = self.width // 4
-        else :
-            Width = self.width // 4 + 1
-        Height = self.height 
-        buf = [0x00] * int(Width * Height)
-        idx = 0
-        for j in range(0, Height):
-            for i in range(0, Width):
-                if i == Width -1:
-                    buf[i + j * Width] = (buf_4color[idx] << 6) + (buf_4color[idx+1] << 4)
-                    idx = idx + 2
-                else:
-                    buf[i + j * Width] = (buf_4color[idx] << 6) + (buf_4color[idx+1] << 4) + (buf_4color[idx+2] << 2) + buf_4color[idx+3]
-                    idx = idx + 4
-        return buf
+        return epdbuffer.getbuffer_palette(image, self.width, self.height, PALETTE, 2)
 
     def display(self, image):
         if self.width % 4 == 0 :
@@ -207,13 +178,13 @@ class EPD:
             Width = self.width // 4 + 1
         Height = self.height
 
+        # at most 31 bytes of each line come from the image, the rest of the source line is 0x00
+        Count = min(self.Source_BITS//4, 31)
+        Padding = [0x00] * (self.Source_BITS//4 - Count)
         self.send_command(0x10)
         for j in range(0, Height):
-            for i in range(0, self.Source_BITS//4):
-                if i < 31 :
-                    self.send_data(image[i + j * Width])
-                else :
-                    self.send_data(0x00)
+            self.send_data2(image[j * Width:j * Width + Count])
+            self.send_data2(Padding)
                     
         self.TurnOnDisplay()
         
@@ -223,9 +194,7 @@ class EPD:
 
 
         self.send_command(0x10)
-        for j in range(0, Height):
-            for i in range(0, Width):
-                    self.send_data(color)
+        self.send_data2([color] * Height * Width)
         self.TurnOnDisplay()
 
     def sleep(self):
@@ -30,6 +30,7 @@
 
 import logging
 from . import epdconfig
+from . import epdbuffer
 
 # Display resolution
 EPD_WIDTH       = 128
@@ -62,23 +63,16 @@ class EPD:
         epdconfig.digital_write(self.cs_pin, 1)
 
     def send_data(self, data):
-        epdconfig.digital_write(self.dc_pin, 1)
-        epdconfig.digital_write(self.cs_pin, 0)
-        epdconfig.spi_writebyte([data])
-        epdconfig.digital_write(self.cs_pin, 1)
+        epdconfig.spi_writedata(data)
 
     # send a lot of data   
     def send_data2(self, data):
-        epdconfig.digital_write(self.dc_pin, 1)
-        epdconfig.digital_write(self.cs_pin, 0)
-        epdconfig.spi_writebyte2(data)
-        epdconfig.digital_write(self.cs_pin, 1)
+        epdconfig.spi_writedata(data)
         
     def ReadBusy(self):
         logger.debug("e-Paper busy")
         self.send_command(0X71)
-        while(epdconfig.digital_read(self.busy_pin) == 1):      #  0: idle, 1: busy
-            epdconfig.delay_ms(200)                
+        epdconfig.wait_busy(1)      #  0: idle, 1: busy
         logger.debug("e-Paper busy release")
         
 
@@ -211,60 +205,25 @@ class EPD:
         return 0
 
     def getbuffer(self, image):
-        # logger.debug("bufsiz = ",int(self.width/8) * self.height)
-        buf = [0xFF] * (int(self.width/8) * self.height)
-        image_monocolor = image.convert('1')
-        imwidth, imheight = image_monocolor.size
-        pixels = image_monocolor.load()
-        # logger.debug("imwidth = %d, imheight = %d",imwidth,imheight)
-        if(imwidth == self.width and imheight == self.height):
-            logger.debug("Vertical")
-            for y in range(imheight):
-                for x in range(imwidth):
-                    # Set the bits for the column of pixels at the current position.
-                    if pixels[x, y] == 0:
-                        buf[int((x + y * self.width) / 8)] &= ~(0x80 >> (x % 8))
-        elif(imwidth == self.height and imheight == self.width):
-            logger.debug("Horizontal")
-            for y in range(imheight):
-                for x in range(imwidth):
-                    newx = y
-                    newy = self.height - x - 1
-                    if pixels[x, y] == 0:
-                        buf[int((newx + newy*self.width) / 8)] &= ~(0x80 >> (y % 8))
-        return buf
+        return epdbuffer.getbuffer(image, self.width, self.height)
 
     def display(self, blackimage, ryimage): # ryimage: red or yellow image
-        if(self.width % 8 == 0):
-            Width = self.width // 8
-        else:
-            Width = self.width // 8 +1
-        Height = self.height
         if (blackimage != None):
             self.send_command(0x24)
             self.send_data2(blackimage)        
         if (ryimage != None):
-            for j in range(Height):
-                for i in range(Width):
-                    ryimage[i + j * Width] = ~ryimage[i + j * Width]
+            ryimage = epdbuffer.invert(ryimage)
             self.send_command(0x26)
             self.send_data2(ryimage)
 
         self.TurnOnDisplay()
 
     def display_Fast(self, blackimage, ryimage): # ryimage: red or yellow image
-        if(self.width % 8 == 0):
-            Width = self.width // 8
-        else:
-            Width = self.width // 8 +1
-        Height = self.height
         if (blackimage != None):
             self.send_command(0x24)
             self.send_data2(blackimage)        
         if (ryimage != None):
-            for j in range(Height):
-                for i in range(Width):
-                    ryimage[i + j * Width] = ~ryimage[i + j * Width]
+            ryimage = epdbuffer.invert(ryimage)
             self.send_command(0x26)
             self.send_data2(ryimage)
 
@@ -287,27 +246,18 @@ class EPD:
         self.TurnOnDisplay_Fast()
 
     def display_Base(self, blackimage, ryimage):
-        if(self.width % 8 == 0):
-            Width = self.width // 8
-        else:
-            Width = self.width // 8 +1
-        Height = self.height
         if (blackimage != None):
             self.send_command(0x24)
             self.send_data2(blackimage)        
         if (ryimage != None):
-            for j in range(Height):
-                for i in range(Width):
-                    ryimage[i + j * Width] = ~ryimage[i + j * Width]
+            ryimage = epdbuffer.invert(ryimage)
             self.send_command(0x26)
             self.send_data2(ryimage)
 
         self.TurnOnDisplay_Base()
 
         if (blackimage != None):
-            for j in range(Height):
-                for i in range(Width):
-                    blackimage[i + j * Width] = ~blackimage[i + j * Width]
+            blackimage = epdbuffer.invert(blackimage)
             self.send_command(0x26)
             self.send_data2(blackimage)
         else:
@@ -321,20 +271,14 @@ class EPD:
             Width = self.width // 8 +1
         Height = self.height
         self.send_command(0x24)   #Write Black and White image to RAM
-        for j in range(Height):
-            for i in range(Width):
-                self.send_data(color)
+        self.send_data2([color] * Height * Width)
                 
         self.send_command(0x26)  #Write Black and White image to RAM
-        for j in range(Height):
-            for i in range(Width):
-                self.send_data(~color)
+        self.send_data2([~color & 0xFF] * Height * Width)
         
         self.TurnOnDisplay_Base()
         self.send_command(0x26)   #Write Black and White image to RAM
-        for j in range(Height):
-            for i in range(Width):
-                self.send_data(color) 
+        self.send_data2([color] * Height * Width)
 
     def display_Partial(self, Image, Xstart, Ystart, Xend, Yend):
         if((Xstart % 8 + Xend % 8 == 8 & Xstart % 8 > Xend % 8) | Xstart % 8 + Xend % 8 == 0 | (Xend - Xstart)%8 == 0):
@@ -372,10 +316,8 @@ class EPD:
         self.send_data((Ystart>>8) & 0x01)
 
         self.send_command(0x24)   #Write Black and White image to RAM
-        for j in range(Height):
-            for i in range(Width):
-                if((j > Ystart-1) & (j < (Yend + 1)) & (i > Xstart-1) & (i < (Xend + 1))):
-                    self.send_data(Image[i + j * Width])
+        for j in range(max(Ystart, 0), min(Yend + 1, Height)):
+            self.send_data2(Image[j * Width + max(Xstart, 0):j * Width + min(Xend + 1, Width)])
         self.TurnOnDisplay_Partial()
         
     def sleep(self):
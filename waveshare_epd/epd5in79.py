@@ -30,6 +30,7 @@
 
 import logging
 from . import epdconfig
+from . import epdbuffer
 
 # Display resolution
 EPD_WIDTH       = 792
@@ -113,22 +114,15 @@ class EPD:
         epdconfig.digital_write(self.cs_pin, 1)
 
     def send_data(self, data):
-        epdconfig.digital_write(self.dc_pin, 1)
-        epdconfig.digital_write(self.cs_pin, 0)
-        epdconfig.spi_writebyte([data])
-        epdconfig.digital_write(self.cs_pin, 1)
+        epdconfig.spi_writedata(data)
 
     # send a lot of data   
     def send_data2(self, data):
-        epdconfig.digital_write(self.dc_pin, 1)
-        epdconfig.digital_write(self.cs_pin, 0)
-        epdconfig.spi_writebyte2(data)
-        epdconfig.digital_write(self.cs_pin, 1)
+        epdconfig.spi_writedata(data)
         
     def ReadBusy(self):
         logger.debug("e-Paper busy")
-        while(epdconfig.digital_read(self.busy_pin) == 1):      #  0: idle, 1: busy
-            epdconfig.delay_ms(200)
+        epdconfig.wait_busy(1)      #  0: idle, 1: busy
         logger.debug("e-Paper busy release")
 
     def TurnOnDisplay(self):
@@ -371,64 +365,10 @@ class EPD:
         return 0
 
     def getbuffer(self, image):
-        # logger.debug("bufsiz = ",int(self.width/8) * self.height)
-        buf = [0xFF] * (int(self.width / 8) * self.height)
-        image_monocolor = image.convert('1')
-        imwidth, imheight = image_monocolor.size
-        pixels = image_monocolor.load()
-        # logger.debug("imwidth = %d, imheight = %d",imwidth,imheight)
-        if imwidth == self.width and imheight == self.height:
-            logger.debug("Horizontal")
-            for y in range(imheight):
-                for x in range(imwidth):
-                    # Set the bits for the column of pixels at the current position.
-                    if pixels[x, y] == 0:
-                        buf[int((x + y * self.width) / 8)] &= ~(0x80 >> (x % 8))
-        elif imwidth == self.height and imheight == self.width:
-            logger.debug("Vertical")
-            for y in range(imheight):
-                for x in range(imwidth):
-                    newx = y
-                    newy = self.height - x - 1
-                    if pixels[x, y] == 0:
-                        buf[int((newx + newy * self.width) / 8)] &= ~(0x80 >> (y % 8))
-        return buf
-    
+        return epdbuffer.getbuffer(image, self.width, self.height)
+
     def getbuffer_4Gray(self, image):
-        # logger.debug("bufsiz = ",int(self.width/8) * self.height)
-        buf = [0xFF] * (int(self.width / 4) * self.height)
-        image_monocolor = image.convert('L')
-        imwidth, imheight = image_monocolor.size
-        pixels = image_monocolor.load()
-        i=0
-        # logger.debug("imwidth = %d, imheight = %d",imwidth,imheight)
-        if(imwidth == self.width and imheight == self.height):
-            logger.debug("Vertical")
-            for y in range(imheight):
-                for x in range(imwidth):
-                    # Set the bits for the column of pixels at the current position.
-                    if(pixels[x, y] == 0xC0):
-                        pixels[x, y] = 0x80
-                    elif (pixels[x, y] == 0x80):
-                        pixels[x, y] = 0x40
-                    i= i+1
-                    if(i%4 == 0):
-                        buf[int((x + (y * self.width))/4)] = ((pixels[x-3, y]&0xc0) | (pixels[x-2, y]&0xc0)>>2 | (pixels[x-1, y]&0xc0)>>4 | (pixels[x, y]&0xc0)>>6)
-                        
-        elif(imwidth == self.height and imheight == self.width):
-            logger.debug("Horizontal")
-            for x in range(imwidth):
-                for y in range(imheight):
-                    newx = y
-                    newy = self.height - x - 1
-                    if(pixels[x, y] == 0xC0):
-                        pixels[x, y] = 0x80
-                    elif (pixels[x, y] == 0x80):
-                        pixels[x, y] = 0x40
-                    i= i+1
-                    if(i%4 == 0):
-                        buf[int((newx + (newy * self.width))/4)] = ((pixels[x, y-3]&0xc0) | (pixels[x, y-2]&0xc0)>>2 | (pixels[x, y-1]&0xc0)>>4 | (pixels[x, y]&0xc0)>>6) 
-        return buf
+        return epdbuffer.getbuffer_4gray(image, self.width, self.height)
 
     def display(self, imageblack):
         Width =int(self.width / 16)+1
@@ -574,91 +514,24 @@ class EPD:
     def display_4Gray(self, image):
         Width =int(self.width / 16)+1
         Width1 =int(self.width / 8)
+        plane1 = epdbuffer.gray4_plane(image, (3, 1))
+        plane2 = epdbuffer.gray4_plane(image, (3, 2))
+        # each controller gets its half of every line, the halves share one byte
+        left1 = b"".join(plane1[j * Width1 : j * Width1 + Width] for j in range(self.height))
+        left2 = b"".join(plane2[j * Width1 : j * Width1 + Width] for j in range(self.height))
+        right1 = b"".join(plane1[j * Width1 + Width - 1 : j * Width1 + Width * 2 - 1] for j in range(self.height))
+        right2 = b"".join(plane2[j * Width1 + Width - 1 : j * Width1 + Width * 2 - 1] for j in range(self.height))
 
         self.send_command(0x24)
-        for j in range(self.height):   
-            for i in range(Width):
-                temp3=0
-                for o in range(0, 2):
-                    temp1 = image[(j * Width1 + i)*2+o]
-                    for k in range(0, 4):
-                        temp2 = temp1&0xC0 
-                        if(temp2 == 0xC0):
-                            temp3 |= 0x01
-                        elif(temp2 == 0x00):
-                            temp3 |= 0x00  
-                        elif(temp2 == 0x80): 
-                            temp3 |= 0x00 
-                        else: #0x40
-                            temp3 |= 0x01 
-                        if(o!=1 or k!=3):
-                            temp3 <<= 1
-                        temp1 <<= 2
-                self.send_data(temp3)
-            
-        self.send_command(0x26)	       
-        for j in range(self.height):   
-            for i in range(Width):
-                temp3=0
-                for o in range(0, 2):
-                    temp1 = image[(j * Width1 + i)*2+o]
-                    for k in range(0, 4):
-                        temp2 = temp1&0xC0 
-                        if(temp2 == 0xC0):
-                            temp3 |= 0x01
-                        elif(temp2 == 0x00):
-                            temp3 |= 0x00  
-                        elif(temp2 == 0x80): 
-                            temp3 |= 0x01 
-                        else: #0x40
-                            temp3 |= 0x00 
-                        if(o!=1 or k!=3):
-                            temp3 <<= 1
-                        temp1 <<= 2
-                self.send_data(temp3)
+        self.send_data2(left1)
+        self.send_command(0x26)
+        self.send_data2(left2)
 
         self.send_command(0xA4)
-        for j in range(self.height):   
-            for i in range(Width):
-                temp3=0
-                for o in range(0, 2):
-                    temp1 = image[(j * Width1 + i + Width - 1)*2+o]
-                    for k in range(0, 4):
-                        temp2 = temp1&0xC0 
-                        if(temp2 == 0xC0):
-                            temp3 |= 0x01
-                        elif(temp2 == 0x00):
-                            temp3 |= 0x00  
-                        elif(temp2 == 0x80): 
-                            temp3 |= 0x00 
-                        else: #0x40
-                            temp3 |= 0x01 
-                        if(o!=1 or k!=3):
-                            temp3 <<= 1
-                        temp1 <<= 2
-                self.send_data(temp3)
-            
-        self.send_command(0xA6)	       
-        for j in range(self.height):   
-            for i in range(Width):
-                temp3=0
-                for o in range(0, 2):
-                    temp1 = image[(j * Width1 + i + Width - 1)*2+o]
-                    for k in range(0, 4):
-                        temp2 = temp1&0xC0 
-                        if(temp2 == 0xC0):
-                            temp3 |= 0x01
-                        elif(temp2 == 0x00):
-                            temp3 |= 0x00  
-                        elif(temp2 == 0x80): 
-                            temp3 |= 0x01 
-                        else: #0x40
-                            temp3 |= 0x00 
-                        if(o!=1 or k!=3):
-                            temp3 <<= 1
-                        temp1 <<= 2
-                self.send_data(temp3)
-        
+        self.send_data2(right1)
+        self.send_command(0xA6)
+        self.send_data2(right2)
+
         self.TurnOnDisplay_4GRAY()
 
     def Clear(self):
@@ -30,6 +30,7 @@
 
 import logging
 from . import epdconfig
+from . import epdbuffer
 
 # Display resolution
 EPD_WIDTH       = 640
@@ -62,21 +63,14 @@ class EPD:
         epdconfig.digital_write(self.cs_pin, 1)
 
     def send_data(self, data):
-        epdconfig.digital_write(self.dc_pin, 1)
-        epdconfig.digital_write(self.cs_pin, 0)
-        epdconfig.spi_writebyte([data])
-        epdconfig.digital_write(self.cs_pin, 1)
+        epdconfig.spi_writedata(data)
         
     def send_data2(self, data):
-        epdconfig.digital_write(self.dc_pin, 1)
-        epdconfig.digital_write(self.cs_pin, 0)
-        epdconfig.spi_writebyte2(data)
-        epdconfig.digital_write(self.cs_pin, 1)
+        epdconfig.spi_writedata(data)
         
     def ReadBusy(self):
         logger.debug("e-Paper busy")
-        while(epdconfig.digital_read(self.busy_pin) == 0):      # 0: idle, 1: busy
-            epdconfig.delay_ms(100)    
+        epdconfig.wait_busy(0)      # 0: idle, 1: busy
         logger.debug("e-Paper busy release")
         
     def init(self):
@@ -125,39 +119,9 @@ class EPD:
         return 0
 
     def getbuffer(self, image):
-        img = image
-        imwidth, imheight = img.size
-        halfwidth = int(self.width / 2)
-        buf = [0x33] * halfwidth * self.height
-        
-        if(imwidth == self.width and imheight == self.height):
-            img = img.convert('1')
-        elif(imwidth == self.height and imheight == self.width):
-            img = img.rotate(90, expand=True).convert('1')
-            imwidth, imheight = img.size
-        else:
-            logger.warning("Wrong image dimensions: must be " + str(self.width) + "x" + str(self.height))
-            # return a blank buffer
-            return buf
-        
-        pixels = img.load()
+        # 4 bits per pixel, 0x3 is white and 0x0 black
+        return epdbuffer.getbuffer_levels(image, self.width, self.height, 4, 0x3, blank_value=0x33)
 
-        for y in range(imheight):
-            offset = y * halfwidth
-            for x in range(1, imwidth, 2):
-                i = offset + x // 2
-                if(pixels[x-1, y] > 191):
-                    if(pixels[x, y] > 191):
-                        buf[i] = 0x33
-                    else:
-                        buf[i] = 0x30
-                else:
-                    if(pixels[x, y] > 191):
-                        buf[i] = 0x03
-                    else:
-                        buf[i] = 0x00
-        return buf
-        
     def display(self, image):
         self.send_command(0x10)
         self.send_data2(image)
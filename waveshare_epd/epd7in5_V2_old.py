@@ -30,6 +30,7 @@
 
 import logging
 from . import epdconfig
+from . import epdbuffer
 
 # Display resolution
 EPD_WIDTH       = 800
@@ -216,47 +217,33 @@ class EPD:
         epdconfig.digital_write(self.cs_pin, 1)
 
     def send_data(self, data):
-        epdconfig.digital_write(self.dc_pin, 1)
-        epdconfig.digital_write(self.cs_pin, 0)
-        epdconfig.spi_writebyte([data])
-        epdconfig.digital_write(self.cs_pin, 1)
+        epdconfig.spi_writedata(data)
 
     def send_data2(self, data):
-        epdconfig.digital_write(self.dc_pin, 1)
-        epdconfig.digital_write(self.cs_pin, 0)
-        epdconfig.spi_writebyte2(data)
-        epdconfig.digital_write(self.cs_pin, 1)
+        epdconfig.spi_writedata(data)
 
     def ReadBusy(self):
         logger.debug("e-Paper busy")
         self.send_command(0x71)
-        busy = epdconfig.digital_read(self.busy_pin)
-        while(busy == 0):
-            self.send_command(0x71)
-            busy = epdconfig.digital_read(self.busy_pin)
+        epdconfig.wait_busy(0)
         epdconfig.delay_ms(20)
         logger.debug("e-Paper busy release")
         
     def SetLut(self, lut_vcom, lut_ww, lut_bw, lut_wb, lut_bb):
         self.send_command(0x20)
-        for count in range(0, 42):
-            self.send_data(lut_vcom[count])
+        self.send_data2(lut_vcom[0:42])
 
         self.send_command(0x21)
-        for count in range(0, 42):
-            self.send_data(lut_ww[count])
+        self.send_data2(lut_ww[0:42])
 
         self.send_command(0x22)
-        for count in range(0, 42):
-            self.send_data(lut_bw[count])
+        self.send_data2(lut_bw[0:42])
 
         self.send_command(0x23)
-        for count in range(0, 42):
-            self.send_data(lut_wb[count])
+        self.send_data2(lut_wb[0:42])
 
         self.send_command(0x24)
-        for count in range(0, 42):
-            self.send_data(lut_bb[count])
+        self.send_data2(lut_bb[0:42])
 
     def init(self):
         if (epdconfig.module_init() != 0):
@@ -425,35 +412,12 @@ class EPD:
     
 
     def getbuffer(self, image):
-        img = image
-        imwidth, imheight = img.size
-        if(imwidth == self.width and imheight == self.height):
-            img = img.convert('1')
-        elif(imwidth == self.height and imheight == self.width):
-            # image has correct dimensions, but needs to be rotated
-            img = img.rotate(90, expand=True).convert('1')
-        else:
-            logger.warning("Wrong image dimensions: must be " + str(self.width) + "x" + str(self.height))
-            # return a blank buffer
-            return [0x00] * (int(self.width/8) * self.height)
-
-        buf = bytearray(img.tobytes('raw'))
         # The bytes need to be inverted, because in the PIL world 0=black and 1=white, but
         # in the e-paper world 0=white and 1=black.
-        for i in range(len(buf)):
-            buf[i] ^= 0xFF
-        return buf
+        return epdbuffer.getbuffer(image, self.width, self.height, inverted=True, blank_value=0x00)
 
     def display(self, image):
-        if(self.width % 8 == 0):
-            Width = self.width // 8
-        else:
-            Width = self.width // 8 +1
-        Height = self.height
-        image1 = [0xFF] * int(self.width * self.height / 8)
-        for j in range(Height):
-                for i in range(Width):
-                    image1[i + j * Width] = ~image[i + j * Width]
+        image1 = epdbuffer.invert(image)
         self.send_command(0x10)
         self.send_data2(image1)
 
@@ -506,10 +470,8 @@ class EPD:
         self.send_data ((Yend-1)%256)  #y-end
         self.send_data (0x01)
 
-        image1 = [0xFF] * int(self.width * self.height / 8)
-        for j in range(Height):
-                for i in range(Width):
-                    image1[i + j * Width] = ~Image[i + j * Width]
+        # only the window's bytes, the controller takes Width x Height of them
+        image1 = epdbuffer.invert(Image[:Width * Height])
 
         self.send_command(0x13)   #Write Black and White image to RAM
         self.send_data2(image1)
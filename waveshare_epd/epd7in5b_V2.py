@@ -30,6 +30,7 @@
 
 import logging
 from . import epdconfig
+from . import epdbuffer
 
 # Display resolution
 EPD_WIDTH       = 800
@@ -63,24 +64,15 @@ class EPD:
         epdconfig.digital_write(self.cs_pin, 1)
 
     def send_data(self, data):
-        epdconfig.digital_write(self.dc_pin, 1)
-        epdconfig.digital_write(self.cs_pin, 0)
-        epdconfig.spi_writebyte([data])
-        epdconfig.digital_write(self.cs_pin, 1)
+        epdconfig.spi_writedata(data)
     
     def send_data2(self, data): #faster
-        epdconfig.digital_write(self.dc_pin, 1)
-        epdconfig.digital_write(self.cs_pin, 0)
-        epdconfig.spi_writebyte2(data)
-        epdconfig.digital_write(self.cs_pin, 1)
+        epdconfig.spi_writedata(data)
 
     def ReadBusy(self):
         logger.debug("e-Paper busy")
         self.send_command(0x71)
-        busy = epdconfig.digital_read(self.busy_pin)
-        while(busy == 0):
-            self.send_command(0x71)
-            busy = epdconfig.digital_read(self.busy_pin)
+        epdconfig.wait_busy(0)
         epdconfig.delay_ms(200)
         logger.debug("e-Paper busy release")
         
@@ -185,24 +177,9 @@ class EPD:
         return 0
 
     def getbuffer(self, image):
-        img = image
-        imwidth, imheight = img.size
-        if(imwidth == self.width and imheight == self.height):
-            img = img.convert('1')
-        elif(imwidth == self.height and imheight == self.width):
-            # image has correct dimensions, but needs to be rotated
-            img = img.rotate(90, expand=True).convert('1')
-        else:
-            logger.warning("Wrong image dimensions: must be " + str(self.width) + "x" + str(self.height))
-            # return a blank buffer
-            return [0x00] * (int(self.width/8) * self.height)
-
-        buf = bytearray(img.tobytes('raw'))
         # The bytes need to be inverted, because in the PIL world 0=black and 1=white, but
         # in the e-paper world 0=white and 1=black.
-        for i in range(len(buf)):
-            buf[i] ^= 0xFF
-        return buf
+        return epdbuffer.getbuffer(image, self.width, self.height, inverted=True, blank_value=0x00)
 
     def display(self, imageblack, imagered):
         self.send_command(0x10)
@@ -225,14 +202,10 @@ class EPD:
             Width = self.width // 8 +1
         Height = self.height
         self.send_command(0x10)   #Write Black and White image to RAM
-        for j in range(Height):
-            for i in range(Width):
-                self.send_data(color)
+        self.send_data2([color] * Height * Width)
                 
         self.send_command(0x13)  #Write Black and White image to RAM
-        for j in range(Height):
-            for i in range(Width):
-                self.send_data(~color)
+        self.send_data2([~color & 0xFF] * Height * Width)
 
         self.send_command(0x12)
         epdconfig.delay_ms(100)
@@ -275,8 +248,7 @@ class EPD:
             self.partFlag = 0
             self.send_command(0x10)
             for j in range(Height):
-                    for i in range(Width):
-                        self.send_data(0xff)
+                    self.send_data2([0xff] * Width)
 
         self.send_command(0x13)   #Write Black and White image to RAM
         self.send_data2(Image)
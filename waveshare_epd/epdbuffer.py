@@ -0,0 +1,192 @@
+# *****************************************************************************
+# * | File        :	  epdbuffer.py
+# * | Function    :   Image to frame buffer conversion shared by the drivers
+# * | Info        :
+# *----------------
+# * | Info        :   Packing is done by PIL and bytes.translate instead of
+# * |                 per-pixel Python loops, so a full frame takes well under
+# * |                 a millisecond.
+# ******************************************************************************
+
+import logging
+import functools
+from PIL import Image, ImageChops
+
+logger = logging.getLogger(__name__)
+
+# In the PIL world 0=black and 1=white, some controllers want it the other way around
+INVERT = bytes(0xFF ^ i for i in range(256))
+
+# two 0/255 pixels packed as nibbles -> their two bits
+PAIRS = bytearray(256)
+INVERTED_PAIRS = bytearray(256)
+for nibbles, code in ((0x00, 0b00), (0x0F, 0b01), (0xF0, 0b10), (0xFF, 0b11)):
+    PAIRS[nibbles] = code
+    INVERTED_PAIRS[nibbles] = code ^ 0b11
+PAIRS = bytes(PAIRS)
+INVERTED_PAIRS = bytes(INVERTED_PAIRS)
+
+# 4-gray: white 0xFF -> 3, GRAY2 0xC0 -> 2, GRAY3 0x80 -> 1, black 0x00 -> 0,
+# any other gray keeps its two top bits
+GRAY4_LEVELS = bytes(2 if v == 0xC0 else 1 if v == 0x80 else v >> 6 for v in range(256))
+
+
+def invert(buf):
+    """Returns buf with every byte inverted, as bytes."""
+    return bytes(buf).translate(INVERT)
+
+
+def orient(image, width, height, mode='1', rotation=Image.Transpose.ROTATE_90):
+    """
+    Converts image to mode and turns it into panel orientation (width x height).
+    The default rotation is the old pixel loops' newx = y, newy = height - x - 1.
+    Returns None if the image has neither the panel's nor the rotated dimensions.
+    """
+    imwidth, imheight = image.size
+    if imwidth == width and imheight == height:
+        logger.debug("Horizontal")
+        return image.convert(mode)
+    if imwidth == height and imheight == width:
+        logger.debug("Vertical")
+        return image.convert(mode).transpose(rotation)
+    logger.warning("Wrong image dimensions: must be " + str(width) + "x" + str(height))
+    return None
+
+
+def linewidth(width, bits=1):
+    """Number of bytes per line for bits per pixel, lines are padded to whole bytes."""
+    return (width * bits + 7) // 8
+
+
+def blank(width, height, value=0xFF, bits=1):
+    return bytearray([value]) * (linewidth(width, bits) * height)
+
+
+def window(buffer, width, region):
+    """
+    The bytes of the window x0, y0 .. x1, y1 (x on whole bytes, x1/y1 exclusive)
+    of a 1 bit frame buffer, line by line.
+    """
+    x0, y0, x1, y1 = region
+    row_bytes = linewidth(width)
+    b0, b1 = x0 // 8, x1 // 8
+    data = bytes(buffer)
+    return b"".join(data[y * row_bytes + b0:y * row_bytes + b1] for y in range(y0, y1))
+
+
+def pack_1bit(img, inverted=False):
+    """
+    Packs a mode '1' image MSB first, one bit per pixel, 1=white (1=black if inverted).
+    Padding bits at the end of each line are white.
+    """
+    imwidth, imheight = img.size
+    if imwidth % 8:
+        padded = Image.new('1', (linewidth(imwidth) * 8, imheight), 1)
+        padded.paste(img, (0, 0))
+        img = padded
+        imwidth = padded.width
+    # PIL's own 1 bit packer walks the image bit by bit. Packing the 0/255 pixels
+    # as nibbles, mapping each nibble pair to a 2 bit code and packing those again
+    # gives the same bytes several times faster.
+    pairs = img.convert('P').tobytes('raw', 'P;4').translate(INVERTED_PAIRS if inverted else PAIRS)
+    return bytearray(Image.frombytes('P', (imwidth // 2, imheight), pairs).tobytes('raw', 'P;2'))
+
+
+def pack_indices(indices, size, bits):
+    """
+    Packs one value per byte (palette index or gray level, 0..2**bits-1) into
+    bits per pixel, MSB first, lines padded to whole bytes.
+    """
+    return bytearray(Image.frombytes('P', size, bytes(indices)).tobytes('raw', 'P;%d' % bits))
+
+
+def getbuffer(image, width, height, inverted=False, blank_value=0xFF):
+    """
+    1 bit per pixel frame buffer for monochrome panels and the black/red planes of
+    tri-colour panels. inverted=True gives 1=black for controllers that want that.
+    A wrongly sized image gives a buffer filled with blank_value.
+    """
+    img = orient(image, width, height)
+    if img is None:
+        return blank(width, height, blank_value)
+    return pack_1bit(img, inverted)
+
+
+def getbuffer_levels(image, width, height, bits, white, blank_value=0x00):
+    """
+    Monochrome buffer for controllers that take several bits per pixel:
+    black pixels become 0 and white pixels become white.
+    """
+    img = orient(image, width, height)
+    if img is None:
+        return blank(width, height, blank_value, bits)
+    levels = img.convert('L').tobytes().translate(bytes([0] * 255 + [white]))
+    return pack_indices(levels, img.size, bits)
+
+
+def getbuffer_4gray(image, width, height, rotation=Image.Transpose.ROTATE_90):
+    """
+    2 bits per pixel buffer (3=white .. 0=black) for the drivers' display_4Gray.
+    A wrongly sized image gives a white buffer.
+    """
+    img = orient(image, width, height, 'L', rotation)
+    if img is None:
+        return blank(width, height, 0xFF, 2)
+    return pack_indices(img.tobytes().translate(GRAY4_LEVELS), img.size, 2)
+
+
+@functools.lru_cache(maxsize=None)
+def _gray4_plane_table(codes):
+    # one 4-gray byte (4 pixels) -> the 4 bits those pixels get in the plane
+    table = bytearray(256)
+    for byte in range(256):
+        for k in range(4):
+            if (byte >> (6 - 2 * k)) & 0x03 in codes:
+                table[byte] |= 0x08 >> k
+    return bytes(table)
+
+
+def gray4_plane(buf, codes):
+    """
+    One of the two 1 bit planes the controller takes in 4-gray mode, made from a
+    getbuffer_4gray buffer. A pixel's bit is 1 when its 2 bit code is in codes.
+    """
+    nibbles = bytes(buf).translate(_gray4_plane_table(frozenset(codes)))
+    return bytearray(Image.frombytes('P', (len(nibbles), 1), nibbles).tobytes('raw', 'P;4'))
+
+
+@functools.lru_cache(maxsize=None)
+def palette_image(colors):
+    """
+    P image with colors (a tuple of RGB tuples) as its palette, for Image.quantize.
+    The rest of the 256 entries are black, as in the drivers' own palettes.
+    """
+    pal_image = Image.new("P", (1, 1))
+    pal_image.putpalette([c for rgb in colors for c in rgb] + [0, 0, 0] * (256 - len(colors)))
+    return pal_image
+
+
+def getbuffer_palette(image, width, height, colors, bits, exact=False):
+    """
+    Buffer for colour panels: one palette index per pixel, bits per pixel, MSB first.
+    By default the image is quantized (dithered) to colors. With exact=True only
+    pixels that are exactly one of the colors keep it, every other pixel gets index 0.
+    A wrongly sized image gives a buffer filled with index 1 (white).
+    """
+    img = orient(image, width, height, 'RGB')
+    if img is None:
+        white = 0
+        for _ in range(8 // bits):
+            white = (white << bits) | 1
+        return bytes(blank(width, height, white, bits))
+
+    pal_image = palette_image(tuple(colors))
+    if not exact:
+        indexed = img.quantize(palette=pal_image)
+    else:
+        indexed = img.quantize(palette=pal_image, dither=Image.Dither.NONE)
+        # pixels whose nearest colour is not an exact match go to index 0
+        diff = ImageChops.difference(img, indexed.convert('RGB')).split()
+        mismatch = ImageChops.lighter(ImageChops.lighter(diff[0], diff[1]), diff[2])
+        indexed.paste(0, mask=mismatch.point(lambda v: 255 if v else 0))
+    return indexed.tobytes('raw', 'P;%d' % bits)
@@ -31,12 +31,28 @@ import os
 import logging
 import sys
 import time
-import subprocess
+import platform
+import functools
 
 from ctypes import *
 
 logger = logging.getLogger(__name__)
 
+# SPI clock and the longest single transfer. Both can be set per deployment through
+# EPD_SPI_SPEED_HZ / EPD_SPI_CHUNK_SIZE or per panel with configure_spi(), see
+# spi_selftest.py for finding the fastest clock a panel works at.
+SPI_SPEED_HZ = int(os.environ.get('EPD_SPI_SPEED_HZ', 4000000))
+# spidev refuses transfers longer than its bufsiz module parameter, 4096 by default
+SPI_CHUNK_SIZE = int(os.environ.get('EPD_SPI_CHUNK_SIZE', 4096))
+
+# seconds a panel may keep BUSY asserted before it counts as hung, the slowest
+# colour panels need around 30 s for a full refresh
+BUSY_TIMEOUT = 60
+
+
+class BusyTimeoutError(RuntimeError):
+    pass
+
 
 class RaspberryPi:
     # Pin definition
@@ -98,6 +114,13 @@ class RaspberryPi:
     def delay_ms(self, delaytime):
         time.sleep(delaytime / 1000.0)
 
+    def wait_busy(self, busy_level, timeout):
+        # the Button is active while BUSY is high, gpiozero sets its events from
+        # the pin's edge callbacks so waiting on them does not poll
+        if busy_level:
+            return self.GPIO_BUSY_PIN.wait_for_inactive(timeout)
+        return self.GPIO_BUSY_PIN.wait_for_active(timeout)
+
     def spi_writebyte(self, data):
         self.SPI.writebytes(data)
 
@@ -123,9 +146,10 @@ class RaspberryPi:
                 '/usr/lib',
             ]
             self.DEV_SPI = None
+            # the library has to match this process, not whatever getconf says about the OS
+            val = 64 if sys.maxsize > 2**32 else 32
+            logging.debug("System is %d bit"%val)
             for find_dir in find_dirs:
-                val = int(os.popen('getconf LONG_BIT').read())
-                logging.debug("System is %d bit"%val)
                 if val == 64:
                     so_filename = os.path.join(find_dir, 'DEV_Config_64.so')
                 else:
@@ -134,14 +158,14 @@ class RaspberryPi:
                     self.DEV_SPI = CDLL(so_filename)
                     break
             if self.DEV_SPI is None:
-                RuntimeError('Cannot find DEV_Config.so')
+                raise RuntimeError('Cannot find DEV_Config.so')
 
             self.DEV_SPI.DEV_Module_Init()
 
         else:
             # SPI device, bus = 0, device = 0
             self.SPI.open(0, 0)
-            self.SPI.max_speed_hz = 4000000
+            self.SPI.max_speed_hz = SPI_SPEED_HZ
             self.SPI.mode = 0b00
         return 0
 
@@ -201,6 +225,17 @@ class JetsonNano:
     def delay_ms(self, delaytime):
         time.sleep(delaytime / 1000.0)
 
+    def wait_busy(self, busy_level, timeout):
+        edge = self.GPIO.FALLING if busy_level else self.GPIO.RISING
+        deadline = time.monotonic() + timeout
+        while self.GPIO.input(self.BUSY_PIN) == busy_level:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            # short waits, an edge between the read and the wait then only costs one of them
+            self.GPIO.wait_for_edge(self.BUSY_PIN, edge, timeout=max(1, int(min(remaining, 0.1) * 1000)))
+        return True
+
     def spi_writebyte(self, data):
         self.SPI.SYSFS_software_spi_transfer(data[0])
 
@@ -259,6 +294,17 @@ class SunriseX3:
     def delay_ms(self, delaytime):
         time.sleep(delaytime / 1000.0)
 
+    def wait_busy(self, busy_level, timeout):
+        edge = self.GPIO.FALLING if busy_level else self.GPIO.RISING
+        deadline = time.monotonic() + timeout
+        while self.GPIO.input(self.BUSY_PIN) == busy_level:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            # short waits, an edge between the read and the wait then only costs one of them
+            self.GPIO.wait_for_edge(self.BUSY_PIN, edge, timeout=max(1, int(min(remaining, 0.1) * 1000)))
+        return True
+
     def spi_writebyte(self, data):
         self.SPI.writebytes(data)
 
@@ -282,7 +328,7 @@ class SunriseX3:
         
             # SPI device, bus = 0, device = 0
             self.SPI.open(2, 0)
-            self.SPI.max_speed_hz = 4000000
+            self.SPI.max_speed_hz = SPI_SPEED_HZ
             self.SPI.mode = 0b00
             return 0
         else:
@@ -301,22 +347,234 @@ class SunriseX3:
         self.GPIO.cleanup([self.RST_PIN, self.DC_PIN, self.CS_PIN, self.BUSY_PIN], self.PWR_PIN)
 
 
-if sys.version_info[0] == 2:
-    process = subprocess.Popen("cat /proc/cpuinfo | grep Raspberry", shell=True, stdout=subprocess.PIPE)
-else:
-    process = subprocess.Popen("cat /proc/cpuinfo | grep Raspberry", shell=True, stdout=subprocess.PIPE, text=True)
-output, _ = process.communicate()
-if sys.version_info[0] == 2:
-    output = output.decode(sys.stdout.encoding)
+class SPIDataBuffer:
+    """
+    Buffered transport for data bytes. The drivers' send_data/send_data2 only
+    append to the buffer, it is written with DC high as writebytes2 transfers of
+    at most chunk_size bytes when it fills up and before anything else touches
+    the pins or the bus (next command, pin reads/writes, delays, module_exit),
+    instead of toggling DC/CS and making a one byte transfer per data byte.
+    """
+
+    def __init__(self, impl, chunk_size=SPI_CHUNK_SIZE):
+        self.impl = impl
+        self.chunk_size = chunk_size
+        self.pending = bytearray()
+
+    def write(self, data):
+        if isinstance(data, int):
+            self.pending.append(data & 0xFF)
+        else:
+            try:
+                self.pending.extend(data)
+            except ValueError:
+                # e.g. ~byte values, spidev only ever sent the low 8 bits of those
+                self.pending.extend(value & 0xFF for value in data)
+        if len(self.pending) >= self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        if not self.pending:
+            return
+        data, self.pending = self.pending, bytearray()
+        self.impl.digital_write(self.impl.DC_PIN, 1)
+        self.impl.digital_write(self.impl.CS_PIN, 0)
+        for start in range(0, len(data), self.chunk_size):
+            self.impl.spi_writebyte2(data[start:start + self.chunk_size])
+        self.impl.digital_write(self.impl.CS_PIN, 1)
+
+
+class Mock:
+    """
+    Stand-in for development machines without a panel: pin writes are kept,
+    SPI bytes are counted and thrown away, delays and BUSY waits return at once.
+    """
+    # Pin definition
+    RST_PIN  = 17
+    DC_PIN   = 25
+    CS_PIN   = 8
+    BUSY_PIN = 24
+    PWR_PIN  = 18
+
+    def __init__(self):
+        self.pins = {}
+        self.bytes_sent = 0
+
+    def digital_write(self, pin, value):
+        self.pins[pin] = value
+
+    def digital_read(self, pin):
+        return self.pins.get(pin, 0)
+
+    def delay_ms(self, delaytime):
+        pass
+
+    def wait_busy(self, busy_level, timeout):
+        return True
+
+    def spi_writebyte(self, data):
+        self.bytes_sent += len(data)
+
+    def spi_writebyte2(self, data):
+        self.bytes_sent += len(data)
+
+    def DEV_SPI_write(self, data):
+        self.bytes_sent += 1
+
+    def DEV_SPI_nwrite(self, data):
+        self.bytes_sent += len(data)
+
+    def DEV_SPI_read(self):
+        return 0
+
+    def module_init(self, cleanup=False):
+        logger.debug("mock e-Paper backend, nothing is sent anywhere")
+        return 0
+
+    def module_exit(self, cleanup=False):
+        logger.debug("spi end")
 
-if "Raspberry" in output:
-    implementation = RaspberryPi()
-elif os.path.exists('/sys/bus/platform/drivers/gpio-x3'):
-    implementation = SunriseX3()
-else:
-    implementation = JetsonNano()
 
-for func in [x for x in dir(implementation) if not x.startswith('_')]:
-    setattr(sys.modules[__name__], func, getattr(implementation, func))
+PLATFORMS = {
+    'raspberrypi': RaspberryPi,
+    'jetsonnano': JetsonNano,
+    'sunrisex3': SunriseX3,
+    'mock': Mock,
+}
+
+
+def _read(path):
+    try:
+        with open(path, 'rb') as f:
+            return f.read().decode('utf-8', 'replace')
+    except OSError:
+        return ''
+
+
+@functools.lru_cache(maxsize=None)
+def detect_platform():
+    """
+    Name of the board's backend in PLATFORMS. EPD_PLATFORM overrides the detection,
+    EPD_PLATFORM=mock runs the drivers without hardware.
+    """
+    name = os.environ.get('EPD_PLATFORM', '').strip().lower()
+    if name:
+        return name
+    if platform.system() != 'Linux':
+        return 'mock'
+    model = _read('/proc/device-tree/model')
+    if 'Raspberry' in model or 'Raspberry' in _read('/proc/cpuinfo'):
+        return 'raspberrypi'
+    if os.path.exists('/sys/bus/platform/drivers/gpio-x3'):
+        return 'sunrisex3'
+    if 'Jetson' in model or os.path.exists('/etc/nv_tegra_release'):
+        return 'jetsonnano'
+    logger.warning("No supported board found, using the mock backend (set EPD_PLATFORM to choose one)")
+    return 'mock'
+
+
+_implementation = None
+# names set from the backend, set_implementation replaces exactly these
+_exported = set()
+
+
+def set_implementation(implementation):
+    """
+    Makes implementation the board backend and exports its pins and functions
+    as this module's, e.g. a simulated board instead of the detected one.
+    """
+    global _implementation
+    data_buffer.flush()
+    data_buffer.impl = implementation
+    module = sys.modules[__name__]
+    for func in _exported - set(dir(implementation)):
+        delattr(module, func)
+        _exported.discard(func)
+    for func in [x for x in dir(implementation) if not x.startswith('_')]:
+        # this module's own functions (wait_busy, ...) wrap the backend's
+        if func in module.__dict__ and func not in _exported:
+            continue
+        value = getattr(implementation, func)
+        if func in FLUSH_FIRST:
+            # everything that touches the pins or the bus writes the queued data first
+            value = _flush_first(value)
+        setattr(module, func, value)
+        _exported.add(func)
+    module.implementation = implementation
+    _implementation = implementation
+
+
+def get_implementation():
+    """The board backend, detected and set up on first use."""
+    if _implementation is None:
+        name = detect_platform()
+        if name not in PLATFORMS:
+            raise ValueError("Unknown EPD_PLATFORM %r, must be one of %s" % (name, ", ".join(sorted(PLATFORMS))))
+        set_implementation(PLATFORMS[name]())
+    return _implementation
+
+
+def __getattr__(name):
+    # pins and functions of the backend appear on first use, so importing the
+    # drivers touches no hardware
+    if name.startswith('__'):
+        raise AttributeError(name)
+    get_implementation()
+    try:
+        return globals()[name]
+    except KeyError:
+        raise AttributeError("module %r has no attribute %r" % (__name__, name))
+
+
+data_buffer = SPIDataBuffer(None)
+
+
+def spi_writedata(data):
+    """Queues data bytes (an int or a sequence of them) for the panel."""
+    data_buffer.write(data)
+
+
+def spi_flush():
+    data_buffer.flush()
+
+
+def configure_spi(speed_hz=None, chunk_size=None):
+    """
+    Sets the SPI clock and transfer size. The clock is used from the next
+    module_init (the drivers' init), the chunk size right away.
+    """
+    global SPI_SPEED_HZ, SPI_CHUNK_SIZE
+    data_buffer.flush()
+    if speed_hz is not None:
+        SPI_SPEED_HZ = int(speed_hz)
+    if chunk_size is not None:
+        SPI_CHUNK_SIZE = int(chunk_size)
+        data_buffer.chunk_size = SPI_CHUNK_SIZE
+    logger.debug("SPI %d Hz, %d byte transfers" % (SPI_SPEED_HZ, SPI_CHUNK_SIZE))
+
+
+def wait_busy(busy_level, timeout=None):
+    """
+    Returns once the BUSY pin has left busy_level, sleeping on the pin's edge
+    instead of polling it. Raises BusyTimeoutError if the panel is still busy
+    after timeout seconds (BUSY_TIMEOUT by default).
+    """
+    data_buffer.flush()
+    if timeout is None:
+        timeout = BUSY_TIMEOUT
+    if not get_implementation().wait_busy(busy_level, timeout):
+        raise BusyTimeoutError("e-Paper still busy after %s s" % timeout)
+
+
+def _flush_first(func):
+    def wrapper(*args, **kwargs):
+        data_buffer.flush()
+        return func(*args, **kwargs)
+    wrapper.__name__ = func.__name__
+    return wrapper
+
+
+FLUSH_FIRST = ['digital_write', 'digital_read', 'delay_ms', 'spi_writebyte', 'spi_writebyte2',
+               'DEV_SPI_write', 'DEV_SPI_nwrite', 'DEV_SPI_read', 'module_exit']
 
 ### END OF FILE ###
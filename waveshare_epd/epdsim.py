@@ -0,0 +1,172 @@
+# *****************************************************************************
+# * | File        :	  epdsim.py
+# * | Function    :   Simulated e-Paper panel for running without hardware
+# * | Info        :   python -m waveshare_epd.epdsim [driver]
+# *----------------
+# * | Info        :   SimulatedPanel runs a real driver on a simulated board that
+# * |                 records every command with its data bytes, and models
+# * |                 the time the panel would take: SPI wire time at the
+# * |                 configured clock, the driver's own delays and the full,
+# * |                 fast or partial refresh of the panel.
+# ******************************************************************************
+
+import logging
+import time
+
+from . import epdconfig, panels
+
+logger = logging.getLogger(__name__)
+
+# (full, fast, partial) refresh in seconds, roughly the datasheet figures
+REFRESH_TIMES = {
+    'epd7in5_V2': (5.0, 1.5, 0.4),
+    'epd7in5_V2_old': (5.0, 1.5, 0.4),
+    'epd7in5_HD': (5.0, 5.0, 5.0),
+    'epd7in5b_V2': (16.0, 16.0, 16.0),
+    'epd4in2_V2': (4.0, 1.5, 0.4),
+    'epd4in26': (3.5, 1.5, 0.4),
+    'epd13in3k': (3.5, 1.5, 0.5),
+    'epd2in13_V4': (2.0, 1.0, 0.3),
+    'epd2in9_V2': (3.0, 1.0, 0.3),
+    'epd5in65f': (12.0, 12.0, 12.0),
+    'epd7in3f': (35.0, 35.0, 35.0),
+    'epd7in3e': (20.0, 20.0, 20.0),
+}
+DEFAULT_REFRESH_TIMES = (4.0, 1.5, 0.4)
+
+
+class SimulatedBoard(epdconfig.Mock):
+    """
+    Board backend that keeps the command stream as a list of [command, data]
+    and adds up the time the real panel would have spent.
+    """
+
+    def __init__(self, realtime=False):
+        super().__init__()
+        self.realtime = realtime
+        self.log = []
+        self.elapsed = 0.0
+
+    def advance(self, seconds):
+        self.elapsed += seconds
+        if self.realtime:
+            time.sleep(seconds)
+
+    def _write(self, data):
+        self.bytes_sent += len(data)
+        self.advance(len(data) * 8.0 / epdconfig.SPI_SPEED_HZ)
+        if self.pins.get(self.DC_PIN, 1) == 0:
+            for command in data:
+                self.log.append([command, bytearray()])
+        else:
+            if not self.log:
+                self.log.append([None, bytearray()])
+            self.log[-1][1].extend(data)
+
+    def delay_ms(self, delaytime):
+        self.advance(delaytime / 1000.0)
+
+    def spi_writebyte(self, data):
+        self._write(bytes(x & 0xFF for x in data))
+
+    def spi_writebyte2(self, data):
+        self._write(data)
+
+    def DEV_SPI_write(self, data):
+        self._write(bytes([data & 0xFF]))
+
+    def DEV_SPI_nwrite(self, data):
+        self._write(data)
+
+
+class SimulatedPanel(panels.Panel):
+    """
+    Panel whose driver runs on a SimulatedBoard. calls gets one record per driver
+    call with the commands, bytes and modelled time it took, commands the whole
+    command stream since the last reset_log(). With realtime=True every call also
+    takes its modelled time.
+    """
+
+    def __init__(self, name='epd7in5_V2', realtime=False):
+        self.board = SimulatedBoard(realtime)
+        epdconfig.set_implementation(self.board)
+        super().__init__(name)
+        self.full_s, self.fast_s, self.partial_s = REFRESH_TIMES.get(self.name, DEFAULT_REFRESH_TIMES)
+        self.calls = []
+
+    @property
+    def commands(self):
+        return self.board.log
+
+    def reset_log(self):
+        del self.board.log[:]
+        del self.calls[:]
+
+    def _call(self, call, func, args=(), refresh=False):
+        first = len(self.board.log)
+        elapsed = self.board.elapsed
+        start = time.perf_counter()
+        result = func(*args)
+        epdconfig.spi_flush()
+        cpu_s = time.perf_counter() - start
+        refresh_s = 0.0
+        if refresh:
+            refresh_s = {'partial': self.partial_s, 'fast': self.fast_s}.get(self.mode, self.full_s)
+        self.board.advance(refresh_s)
+        log = self.board.log[first:]
+        self.calls.append({
+            'call': call,
+            'mode': self.mode,
+            'commands': len(log),
+            'bytes': sum((command is not None) + len(data) for command, data in log),
+            'cpu_s': cpu_s,
+            'refresh_s': refresh_s,
+            'panel_s': self.board.elapsed - elapsed,
+        })
+        return result
+
+    def report(self, reset=True):
+        """One line per call since the last report, with a total."""
+        lines = []
+        for c in self.calls:
+            lines.append("%-16s %-7s %5d cmd %8d B  cpu %6.1f ms  panel %6.2f s" % (
+                c['call'], c['mode'], c['commands'], c['bytes'], c['cpu_s'] * 1000, c['panel_s']))
+        lines.append("%-16s %-7s %5d cmd %8d B  cpu %6.1f ms  panel %6.2f s" % (
+            'total', '', sum(c['commands'] for c in self.calls), sum(c['bytes'] for c in self.calls),
+            sum(c['cpu_s'] for c in self.calls) * 1000, sum(c['panel_s'] for c in self.calls)))
+        if reset:
+            self.reset_log()
+        return "\n".join(lines)
+
+
+def main():
+    import sys
+    from PIL import Image, ImageDraw
+
+    panel = SimulatedPanel(sys.argv[1] if len(sys.argv) > 1 else 'epd7in5_V2')
+    print(panel)
+    image = Image.new('1', (panel.width, panel.height), 1)
+    draw = ImageDraw.Draw(image)
+    for x in range(0, panel.width, 40):
+        draw.line((x, 0, panel.width - x, panel.height - 1), fill=0)
+    buffer = panel.getbuffer(image)
+
+    panel.init('full')
+    panel.clear()
+    panel.display(buffer)
+    print("full refresh at %.1f MHz:\n%s\n" % (epdconfig.SPI_SPEED_HZ / 1e6, panel.report()))
+
+    panel.init('fast')
+    panel.display(buffer)
+    print("%s refresh:\n%s\n" % (panel.mode, panel.report()))
+
+    # the 80x40 corner changes, panels that refresh windows only get that
+    draw.rectangle((8, 8, 71, 39), fill=0)
+    panel.init('partial')
+    panel.display(panel.getbuffer(image), [(0, 0, 80, 40)])
+    panel.sleep()
+    print("%s refresh:\n%s" % (panel.mode, panel.report()))
+
+
+if __name__ == '__main__':
+    main()
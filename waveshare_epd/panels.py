@@ -0,0 +1,246 @@
+# *****************************************************************************
+# * | File        :	  panels.py
+# * | Function    :   Registry of the drivers and one interface to all of them
+# * | Info        :   Panel('epd7in5_V2') or Panel(driver_module)
+# *----------------
+# * | Info        :   The drivers name the same things differently (init_part,
+# * |                 init_Part, init_Partial; display_Partial, displayPartial,
+# * |                 DisplayPartial ...) and some take extra arguments. Panel
+# * |                 finds the driver's methods, tells what the panel can do
+# * |                 (supports_partial, supports_fast, gray_levels, colors)
+# * |                 and picks the quickest refresh that fits an update.
+# ******************************************************************************
+
+import functools
+import importlib
+import inspect
+import logging
+import os
+import pkgutil
+
+from PIL import Image
+
+from . import epdbuffer
+
+logger = logging.getLogger(__name__)
+
+# refresh modes, quickest first
+MODES = ('partial', 'fast', 'full', 'gray')
+
+# operation -> driver method names, the first one the driver has is used
+METHODS = {
+    'init': ('init',),
+    'init_fast': ('init_fast', 'init_Fast'),
+    'init_partial': ('init_part', 'init_Part', 'init_Partial'),
+    'init_gray': ('init_4Gray', 'Init_4Gray', 'init_4GRAY'),
+    'display': ('display',),
+    'display_base': ('display_Base', 'displayPartBaseImage'),
+    'display_fast': ('display_Fast', 'display_fast'),
+    'display_partial': ('display_Partial', 'displayPartial', 'DisplayPartial', 'displayPart'),
+    'display_gray': ('display_4Gray',),
+    'getbuffer': ('getbuffer',),
+    'getbuffer_gray': ('getbuffer_4Gray',),
+    'clear': ('Clear',),
+    'clear_fast': ('Clear_Fast',),
+    'sleep': ('sleep',),
+}
+
+# drivers that do not fit METHODS, the functions take the Panel
+QUIRKS = {
+    'epd1in02': {
+        'init': lambda p: p.epd.Init(),
+        'init_partial': lambda p: p.epd.Partial_Init(),
+        # the controller wants the previous image along with the new one
+        'display_partial': lambda p, image: p.epd.DisplayPartial(
+            p.last_buffer if p.last_buffer is not None else p.blank_plane(), image),
+        'sleep': lambda p: p.epd.Sleep(),
+    },
+    'epd1in54': {
+        'init': lambda p: p.epd.init(p.epd.lut_full_update),
+        'init_partial': lambda p: p.epd.init(p.epd.lut_partial_update),
+        'display_partial': lambda p, image: p.epd.display(image),
+    },
+    'epd1in54_V2': {
+        'init': lambda p: p.epd.init(False),
+        'init_partial': lambda p: p.epd.init(True),
+    },
+    'epd2in13': {
+        'init': lambda p: p.epd.init(p.epd.lut_full_update),
+        'init_partial': lambda p: p.epd.init(p.epd.lut_partial_update),
+        'display_partial': lambda p, image: p.epd.display(image),
+    },
+    'epd2in13_V2': {
+        'init': lambda p: p.epd.init(p.epd.FULL_UPDATE),
+        'init_partial': lambda p: p.epd.init(p.epd.PART_UPDATE),
+    },
+    'epd2in66': {
+        'init': lambda p: p.epd.init(0),
+        'init_partial': lambda p: p.epd.init(1),
+        'display_partial': lambda p, image: p.epd.display(image),
+    },
+    'epd2in9': {
+        'init': lambda p: p.epd.init(p.epd.lut_full_update),
+        'init_partial': lambda p: p.epd.init(p.epd.lut_partial_update),
+        'display_partial': lambda p, image: p.epd.display(image),
+    },
+    'epd3in7': {
+        'init': lambda p: p.epd.init(1),
+        'init_gray': lambda p: p.epd.init(0),
+        'display': lambda p, image: p.epd.display_1Gray(image),
+        'clear': lambda p: p.epd.Clear(0xFF, 0 if p.mode == 'gray' else 1),
+    },
+    'epd4in2_V2': {
+        'init_fast': lambda p: p.epd.init_fast(p.epd.Seconds_1S),
+    },
+}
+
+# display_Partial of these takes only the window's bytes, the other drivers with
+# a window take the whole frame and pick the window out themselves
+WINDOW_BUFFER = ('epd7in5_V2', 'epd7in5_V2_old', 'epd7in5b_V2')
+
+
+def names():
+    """The driver modules in the package, i.e. the names Panel takes."""
+    path = os.path.dirname(os.path.abspath(__file__))
+    return sorted(m.name for m in pkgutil.iter_modules([path])
+                  if m.name.startswith('epd') and m.name not in ('epdconfig', 'epdbuffer', 'epdsim'))
+
+
+def _parameters(func):
+    return len(inspect.signature(func).parameters)
+
+
+class Panel:
+    """
+    A driver behind one interface: init(mode), clear(), display(buffer, regions),
+    sleep(). mode is one of MODES, display sends the buffer the way mode refreshes.
+    Capabilities:
+      supports_partial  partial refresh without the full flashing
+      partial_regions   partial refresh of windows (x0, y0, x1, y1) only
+      supports_fast     a full refresh with a shorter waveform
+      gray_levels       2, or 4 for panels with a 4-gray mode
+      colors            2 for black/white, 3 for black/white/red (or yellow)
+                        panels, otherwise the number of colours in the palette
+    """
+
+    def __init__(self, driver, epd=None):
+        if isinstance(driver, str):
+            if driver not in names():
+                raise ValueError("Unknown panel %r, one of: %s" % (driver, ", ".join(names())))
+            driver = importlib.import_module('.' + driver, __package__)
+        self.driver = driver
+        self.name = driver.__name__.rsplit('.', 1)[-1]
+        self.epd = epd if epd is not None else driver.EPD()
+        self.width = self.epd.width
+        self.height = self.epd.height
+        self.ops = {op: self._resolve(op) for op in METHODS}
+
+        # bichrome panels take a second (red/yellow) plane
+        self.planes = 2 if _parameters(self.ops['display']) == 2 else 1
+        palette = getattr(driver, 'PALETTE', None)
+        self.colors = len(set(palette)) if palette else self.planes + 1
+        self.gray_levels = 4 if self.ops['display_gray'] else 2
+        self.supports_fast = self.ops['init_fast'] is not None
+        self.supports_partial = self.ops['display_partial'] is not None
+        self.partial_regions = self.supports_partial and _parameters(self.ops['display_partial']) == 5
+
+        self.mode = None
+        self.last_buffer = None
+        self._blank_plane = None
+
+    def __repr__(self):
+        return "Panel(%r, %dx%d, partial=%s, fast=%s, gray_levels=%d, colors=%d)" % (
+            self.name, self.width, self.height, self.supports_partial, self.supports_fast,
+            self.gray_levels, self.colors)
+
+    def _resolve(self, op):
+        quirks = QUIRKS.get(self.name, {})
+        if op in quirks:
+            return functools.partial(quirks[op], self)
+        for name in METHODS[op]:
+            method = getattr(self.epd, name, None)
+            if method is not None:
+                return method
+        return None
+
+    def _call(self, call, func, args=(), refresh=False):
+        # every driver call goes through here, epdsim overrides it to record them
+        return func(*args)
+
+    def blank_plane(self):
+        """A white buffer, for the red/yellow plane that is left empty."""
+        if self._blank_plane is None:
+            self._blank_plane = self.ops['getbuffer'](Image.new('1', (self.width, self.height), 255))
+        return self._blank_plane
+
+    def getbuffer(self, image, gray=False):
+        if gray and self.gray_levels == 4:
+            return self.ops['getbuffer_gray'](image)
+        return self.ops['getbuffer'](image)
+
+    def choose_mode(self, changed, total, force_full=False, full_ratio=0.5):
+        """
+        Quickest mode for an update of changed of total pixels (changed None: the
+        panel shows something unknown). Partial refreshes leave ghosting behind,
+        so the first image, force_full and changes of at least full_ratio get a
+        full-screen refresh, the fast one where the panel has it.
+        """
+        if force_full or changed is None:
+            return 'full'
+        if changed >= total * full_ratio or not self.supports_partial:
+            return 'fast' if self.supports_fast else 'full'
+        return 'partial'
+
+    def init(self, mode='full'):
+        """Wakes the panel up for mode, or the closest mode it has. Returns the driver's result."""
+        if mode == 'partial' and not self.supports_partial:
+            mode = 'fast'
+        if mode == 'fast' and not self.supports_fast:
+            mode = 'full'
+        if mode == 'gray' and self.gray_levels < 4:
+            mode = 'full'
+        self.mode = mode
+        func = self.ops[{'full': 'init', 'fast': 'init_fast', 'partial': 'init_partial', 'gray': 'init_gray'}[mode]]
+        # partial refreshes without their own init run after the normal one
+        return self._call('init', func or self.ops['init'])
+
+    def clear(self):
+        func = self.ops['clear_fast'] if self.mode == 'fast' and self.ops['clear_fast'] else self.ops['clear']
+        self.last_buffer = None
+        return self._call('clear', func, refresh=True)
+
+    def display(self, buffer, regions=None):
+        """
+        Shows the full frame buffer. In partial mode on panels with partial_regions
+        only the regions (x0, y0, x1, y1, x on whole bytes, x1/y1 exclusive) are sent.
+        """
+        if self.mode == 'partial':
+            self._display_partial(buffer, regions)
+        else:
+            if self.mode == 'gray':
+                func = self.ops['display_gray']
+            elif self.mode == 'fast':
+                func = self.ops['display_fast'] or self.ops['display']
+            else:
+                # a full refresh that also writes the controller's previous-image RAM,
+                # partial refreshes are worked out against that
+                func = self.supports_partial and self.ops['display_base'] or self.ops['display']
+            if self.planes == 2 and self.mode != 'gray':
+                self._call('display', func, (buffer, self.blank_plane()), refresh=True)
+            else:
+                self._call('display', func, (buffer,), refresh=True)
+        self.last_buffer = buffer
+
+    def _display_partial(self, buffer, regions):
+        func = self.ops['display_partial']
+        if not self.partial_regions:
+            self._call('display_partial', func, (buffer,), refresh=True)
+            return
+        for region in regions or [(0, 0, self.width, self.height)]:
+            if self.name in WINDOW_BUFFER:
+                self._call('display_partial', func, (epdbuffer.window(buffer, self.width, region),) + tuple(region), refresh=True)
+            else:
+                self._call('display_partial', func, (buffer,) + tuple(region), refresh=True)
+
+    def sleep(self):
+        return self._call('sleep', self.ops['sleep'])
@@ -0,0 +1,126 @@
+# *****************************************************************************
+# * | File        :	  spi_selftest.py
+# * | Function    :   Finds the fastest SPI clock a panel works reliably at
+# * | Info        :   python -m waveshare_epd.spi_selftest epd7in5_V2 [-s 4 8 16] [-r 3]
+# *----------------
+# * | Info        :   The panels have no MISO line, so nothing can be read back.
+# * |                 A speed passes when every round's full refresh starts and
+# * |                 finishes (BUSY goes busy for a plausible time and is then
+# * |                 released). Each round draws a pattern labelled with its
+# * |                 speed, check the panel by eye before trusting a result.
+# ******************************************************************************
+
+import argparse
+import importlib
+import inspect
+import logging
+import time
+
+from PIL import Image, ImageDraw
+
+from . import epdconfig
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SPEEDS_MHZ = [2, 4, 8, 10, 16, 20, 32]
+# a full refresh that is over quicker than this never started, the panel did not
+# take the command stream
+MIN_REFRESH_S = 0.3
+
+
+def test_pattern(width, height, label):
+    """Checkerboard with a border and the label, as a mode '1' image in panel orientation."""
+    image = Image.new('1', (width, height), 1)
+    draw = ImageDraw.Draw(image)
+    for y in range(0, height, 16):
+        for x in range((y // 16) % 2 * 16, width, 32):
+            draw.rectangle((x, y, x + 15, y + 15), fill=0)
+    draw.rectangle((0, 0, width - 1, height - 1), outline=0, width=3)
+    draw.rectangle((8, 8, 8 + 8 * len(label), 24), fill=1)
+    draw.text((10, 10), label, fill=0)
+    return image
+
+
+def show(epd, image):
+    buf = epd.getbuffer(image)
+    # bichrome panels take a second (red/yellow) plane, left empty here
+    if len(inspect.signature(epd.display).parameters) > 1:
+        epd.display(buf, bytearray([0xFF]) * len(buf))
+    else:
+        epd.display(buf)
+
+
+def run_speed(epd, speed_hz, rounds):
+    """
+    Shows the pattern rounds times at speed_hz. Returns (passed, transfer seconds,
+    refresh seconds) of the slowest round.
+    """
+    waited = []
+    wait_busy = epdconfig.wait_busy
+
+    def timed_wait_busy(*args, **kwargs):
+        start = time.monotonic()
+        try:
+            return wait_busy(*args, **kwargs)
+        finally:
+            waited.append(time.monotonic() - start)
+
+    epdconfig.configure_spi(speed_hz=speed_hz)
+    worst = (True, 0.0, 0.0)
+    epdconfig.wait_busy = timed_wait_busy
+    try:
+        for n in range(rounds):
+            image = test_pattern(epd.width, epd.height, "SPI %.1f MHz #%d" % (speed_hz / 1e6, n + 1))
+            epd.init()
+            del waited[:]
+            start = time.monotonic()
+            try:
+                show(epd, image)
+            except epdconfig.BusyTimeoutError as e:
+                logger.warning("%.1f MHz: %s" % (speed_hz / 1e6, e))
+                return False, 0.0, 0.0
+            total = time.monotonic() - start
+            refresh = max(waited) if waited else 0.0
+            if refresh < MIN_REFRESH_S:
+                logger.warning("%.1f MHz: refresh took %.2f s, the panel did not start it" % (speed_hz / 1e6, refresh))
+                return False, total - sum(waited), refresh
+            if total - sum(waited) > worst[1]:
+                worst = (True, total - sum(waited), refresh)
+    finally:
+        epdconfig.wait_busy = wait_busy
+    return worst
+
+
+def main():
+    parser = argparse.ArgumentParser(description="SPI clock self-test for a Waveshare panel")
+    parser.add_argument('driver', help="driver module, e.g. epd7in5_V2")
+    parser.add_argument('-s', '--speeds', type=float, nargs='+', default=DEFAULT_SPEEDS_MHZ, help="clocks to try in MHz, ascending")
+    parser.add_argument('-r', '--rounds', type=int, default=3, help="full refreshes per clock")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    driver = importlib.import_module('.' + args.driver, __package__)
+    epd = driver.EPD()
+    fastest = None
+    try:
+        for mhz in sorted(args.speeds):
+            speed_hz = int(mhz * 1e6)
+            passed, transfer, refresh = run_speed(epd, speed_hz, args.rounds)
+            print("%6.1f MHz  %s  transfer %.3f s  refresh %.2f s" % (mhz, "ok  " if passed else "FAIL", transfer, refresh))
+            if not passed:
+                break
+            fastest = speed_hz
+    finally:
+        epdconfig.configure_spi(speed_hz=fastest or 4000000)
+        epd.init()
+        epd.Clear()
+        epd.sleep()
+
+    if fastest:
+        print("Fastest stable clock: EPD_SPI_SPEED_HZ=%d (check that its pattern looked right)" % fastest)
+    else:
+        print("No clock passed")
+
+
+if __name__ == '__main__':
+    main()